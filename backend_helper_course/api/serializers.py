@@ -248,10 +248,7 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 
 class CustomGroupSerializer(serializers.ModelSerializer):
-    members_count = serializers.IntegerField(
-        source='members.count',
-        read_only=True,
-    )
+    members_count = serializers.SerializerMethodField()
     chat_id = serializers.SerializerMethodField()
 
     class Meta:
@@ -265,8 +262,16 @@ class CustomGroupSerializer(serializers.ModelSerializer):
             'chat_id',
         ]
 
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_members_count(self, group):
+        total = getattr(group, 'members_total', None)
+        return group.members.count() if total is None else total
+
     @extend_schema_field(OpenApiTypes.INT)
     def get_chat_id(self, group):
+        chat_id = getattr(group, 'chat_pk', None)
+        if chat_id is not None:
+            return chat_id
         chat, created = GroupChat.objects.get_or_create(group=group)
         if created:
             user_ids = group.members.filter(is_active=True).values_list(
@@ -285,6 +290,15 @@ class GroupChatSerializer(serializers.ModelSerializer):
         fields = ['id', 'group', 'created_at']
 
 
+class LastMessageSerializer(serializers.ModelSerializer):
+    sender = serializers.IntegerField(source='sender_id', read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender', 'text', 'created_at']
+        read_only_fields = fields
+
+
 class DialogSerializer(serializers.ModelSerializer):
     is_group = serializers.SerializerMethodField()
     partner = serializers.SerializerMethodField()
@@ -292,10 +306,22 @@ class DialogSerializer(serializers.ModelSerializer):
         source='groupchat.group.name',
         read_only=True,
     )
+    last_message = serializers.SerializerMethodField()
+    last_activity_at = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Dialog
-        fields = ['id', 'created_at', 'is_group', 'partner', 'group_name']
+        fields = [
+            'id',
+            'created_at',
+            'is_group',
+            'partner',
+            'group_name',
+            'last_message',
+            'last_activity_at',
+            'unread_count',
+        ]
 
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_is_group(self, obj):
@@ -306,13 +332,42 @@ class DialogSerializer(serializers.ModelSerializer):
         if self.get_is_group(obj):
             return None
         me = self.context['request'].user
-        other = obj.list_users.exclude(id=me.id).first()
+        others = getattr(obj, 'others', None)
+        if others is None:
+            other = obj.list_users.exclude(id=me.id).first()
+        else:
+            other = others[0] if others else None
         return (
             ShortUserSerializer(other, context=self.context).data
             if other
             else None
         )
 
+    def _last_message(self, obj):
+        if not hasattr(obj, 'last_message'):
+            obj.last_message = obj.messages.order_by(
+                '-created_at',
+                '-id',
+            ).first()
+        return obj.last_message
+
+    @extend_schema_field(LastMessageSerializer(allow_null=True))
+    def get_last_message(self, obj):
+        message = self._last_message(obj)
+        return LastMessageSerializer(message).data if message else None
+
+    @extend_schema_field(OpenApiTypes.DATETIME)
+    def get_last_activity_at(self, obj):
+        moment = getattr(obj, 'last_activity_at', None)
+        if moment is None:
+            message = self._last_message(obj)
+            moment = message.created_at if message else obj.created_at
+        return serializers.DateTimeField().to_representation(moment)
+
+    @extend_schema_field(OpenApiTypes.INT)
+    def get_unread_count(self, obj):
+        return getattr(obj, 'unread_count', 0)
+
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = serializers.IntegerField(source='sender.id', read_only=True)
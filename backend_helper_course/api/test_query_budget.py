@@ -0,0 +1,202 @@
+import difflib
+import re
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from custom_groups.models import CustomGroup, GroupMember
+from dialogs.consumers import load_dialog_context
+from dialogs.models import Dialog, GroupChat, Message, Notification
+from dialogs.notifications import unread_batch
+from feedback.models import Feedback
+from interests.models import Interest, UserInterestRating
+from users.models import CustomUser, Liked, Rejected
+
+SIZES = (1, 10, 100)
+
+
+def normalize(sql):
+    sql = re.sub(r"'[^']*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\?(, \?)+', '?...', sql)
+
+
+def capture(run):
+    with CaptureQueriesContext(connection) as ctx:
+        run()
+    return [normalize(q['sql']) for q in ctx.captured_queries]
+
+
+def assert_query_budget(seed, run, sizes=SIZES):
+    base_size, base = None, None
+    for size in sizes:
+        seed(size)
+        queries = capture(run)
+        if base is None:
+            base_size, base = size, queries
+            continue
+        if len(queries) != len(base):
+            diff = '\n'.join(
+                difflib.unified_diff(
+                    base,
+                    queries,
+                    f'{base_size} rows',
+                    f'{size} rows',
+                    lineterm='',
+                ),
+            )
+            pytest.fail(
+                f'{len(base)} queries with {base_size} rows, '
+                f'{len(queries)} with {size}:\n{diff}',
+            )
+
+
+def grow(make):
+    made = []
+
+    def seed(size):
+        while len(made) < size:
+            made.append(make(len(made)))
+
+    return seed
+
+
+def make_user(name):
+    return CustomUser.objects.create(
+        username=name,
+        first_name=name,
+        profile_photo=f'profile_photos/{name}.jpg',
+    )
+
+
+def get_ok(client, url):
+    def run():
+        resp = client.get(url)
+        assert resp.status_code == status.HTTP_200_OK
+
+    return run
+
+
+@pytest.fixture
+def user(db):
+    return make_user('budget_owner')
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def dialog_with(user, partner):
+    dialog = Dialog.objects.create()
+    dialog.list_users.set([user, partner])
+    return dialog
+
+
+@pytest.mark.parametrize('name', ['dialogs-list', 'dialogs-me'])
+def test_dialog_inbox_budget(api_client, user, name):
+    def make(i):
+        partner = make_user(f'partner{i}')
+        dialog = dialog_with(user, partner)
+        Message.objects.create(dialog=dialog, sender=partner, text='hi')
+
+    assert_query_budget(grow(make), get_ok(api_client, reverse(name)))
+
+
+def test_dialog_messages_budget(api_client, user):
+    dialog = dialog_with(user, make_user('partner'))
+
+    def make(i):
+        Message.objects.create(dialog=dialog, sender=user, text=f'm{i}')
+
+    url = reverse('dialogs-messages', args=[dialog.id])
+    assert_query_budget(grow(make), get_ok(api_client, url))
+
+
+def make_group(user, i):
+    group = CustomGroup.objects.create(name=f'group{i}')
+    GroupMember.objects.create(group=group, user=user)
+    GroupMember.objects.create(group=group, user=make_user(f'member{i}'))
+    GroupChat.objects.create(group=group)
+    return group
+
+
+@pytest.mark.parametrize('name', ['groups-list', 'groups-me'])
+def test_group_list_budget(api_client, user, name):
+    seed = grow(lambda i: make_group(user, i))
+    assert_query_budget(seed, get_ok(api_client, reverse(name)))
+
+
+def test_group_members_budget(api_client, user):
+    group = make_group(user, 0)
+
+    def make(i):
+        member = make_user(f'extra{i}')
+        return GroupMember.objects.create(group=group, user=member)
+
+    url = reverse('groups-members', args=[group.id])
+    assert_query_budget(grow(make), get_ok(api_client, url))
+
+
+def test_interactions_budget(api_client, user):
+    def make(i):
+        Liked.objects.create(user=user, liked_user=make_user(f'liked{i}'))
+        Rejected.objects.create(
+            user=user,
+            rejected_user=make_user(f'rejected{i}'),
+            reason=Rejected.SKIP,
+        )
+
+    url = reverse('interactions-list')
+    assert_query_budget(grow(make), get_ok(api_client, url))
+
+
+def test_feedback_budget(api_client, user):
+    def make(i):
+        return Feedback.objects.create(user=user, text=f'feedback{i}')
+
+    url = reverse('feedback-list')
+    assert_query_budget(grow(make), get_ok(api_client, url))
+
+
+def test_profile_me_budget(api_client, user):
+    def make(i):
+        interest = Interest.objects.create(name=f'interest{i}')
+        UserInterestRating.objects.create(
+            user=user,
+            interest=interest,
+            rating=3,
+        )
+
+    def run():
+        api_client.force_authenticate(CustomUser.objects.get(pk=user.pk))
+        get_ok(api_client, reverse('profile-me'))()
+
+    assert_query_budget(grow(make), run)
+
+
+def test_notify_replay_budget(user):
+    def make(i):
+        dialog = dialog_with(user, make_user(f'sender{i}'))
+        Notification.objects.create(user=user, dialog=dialog, text='hi')
+
+    assert_query_budget(grow(make), lambda: unread_batch(user.id))
+
+
+def test_chat_context_budget(user):
+    group = make_group(user, 0)
+    chat = GroupChat.objects.get(group=group)
+
+    def make(i):
+        chat.list_users.add(make_user(f'chatter{i}'))
+
+    assert_query_budget(
+        grow(make),
+        lambda: load_dialog_context(str(chat.id), user.id),
+    )
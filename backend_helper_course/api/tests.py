@@ -9,9 +9,9 @@ from rest_framework.test import APIClient
 
 from api.serializers import MessageSerializer
 from custom_groups.models import CustomGroup, GroupMember
-from dialogs.models import Dialog, Message, Notification
+from dialogs.models import Dialog, DialogMembership, Message, Notification
 from feedback.models import Feedback
-from users.models import CustomUser, Liked, Rejected
+from users.models import CustomUser, Liked, MutualLike, Rejected
 
 
 def reverse(name, *pargs, **pkwargs):
@@ -21,6 +21,7 @@ def reverse(name, *pargs, **pkwargs):
         'group-detail': 'groups-detail',
         'dialog-list': 'dialogs-list',
         'dialog-messages': 'dialogs-messages',
+        'dialog-read': 'dialogs-read',
         'match-list': 'matches-list',
         'match-swipe': 'matches-swipe',
     }
@@ -116,6 +117,262 @@ def test_hello_returns_greeting(api_client, user):
     assert 'Привет' in resp.data['message']
 
 
+@pytest.mark.django_db
+def test_jwt_auth_caches_claims_and_skips_unchanged_writes(
+    api_client,
+    monkeypatch,
+    django_assert_num_queries,
+):
+    import time
+
+    from helper import auth
+
+    auth._claims_cache.clear()
+    auth._user_cache.clear()
+    claims = {
+        'sub': 'kc-1',
+        'preferred_username': 'kc_user',
+        'email': 'kc@example.com',
+        'given_name': 'Kc',
+        'azp': auth.SPA_CLIENT,
+        'exp': int(time.time()) + 60,
+    }
+    tokens = {'one': claims, 'two': {**claims, 'email': 'new@example.com'}}
+    decoded = []
+
+    def fake_decode(self, token):
+        decoded.append(token)
+        return dict(tokens[token])
+
+    monkeypatch.setattr(auth.KeycloakJWTAuthentication, '_decode', fake_decode)
+    url = reverse('hello-list')
+
+    resp = api_client.get(url, HTTP_AUTHORIZATION='Bearer one')
+    assert resp.status_code == status.HTTP_200_OK
+    with django_assert_num_queries(1):
+        resp = api_client.get(url, HTTP_AUTHORIZATION='Bearer one')
+    assert resp.status_code == status.HTTP_200_OK
+    assert decoded == ['one']
+
+    api_client.get(url, HTTP_AUTHORIZATION='Bearer two')
+    user = CustomUser.objects.get(username='kc_user')
+    assert user.email == 'new@example.com'
+    assert user.first_name == 'Kc'
+    assert decoded == ['one', 'two']
+    auth._claims_cache.clear()
+    auth._user_cache.clear()
+
+
+@pytest.mark.django_db
+def test_ws_auth_reuses_cached_claims(user, monkeypatch):
+    import time
+
+    from asgiref.sync import async_to_sync
+    from jwt import InvalidSignatureError
+
+    from helper import auth
+    from helper.ws_auth import TokenAuthMiddleware
+
+    auth._claims_cache.clear()
+    auth._user_cache.clear()
+    decoded = []
+
+    def fake_decode(self, token):
+        decoded.append(token)
+        if token == 'bad':
+            raise InvalidSignatureError(token)
+        return {
+            'preferred_username': user.username,
+            'email': user.email,
+            'given_name': user.first_name,
+            'family_name': user.last_name,
+            'azp': auth.SPA_CLIENT,
+            'exp': int(time.time()) + 60,
+        }
+
+    monkeypatch.setattr(auth.KeycloakJWTAuthentication, '_decode', fake_decode)
+    seen = []
+
+    async def inner(scope, receive, send):
+        seen.append(scope['user'])
+
+    middleware = TokenAuthMiddleware(inner)
+    for query in (b'token=abc', b'token=abc', b'token=bad', b''):
+        async_to_sync(middleware)({'query_string': query}, None, None)
+
+    assert [u.pk for u in seen[:2]] == [user.pk, user.pk]
+    assert seen[2].is_anonymous and seen[3].is_anonymous
+    assert decoded == ['abc', 'bad']
+    auth._claims_cache.clear()
+    auth._user_cache.clear()
+
+
+def test_access_log_samples_routes_and_skips_uploads(settings, caplog):
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+
+    from helper.middleware import AccessLogMiddleware
+
+    settings.ACCESS_LOG = {
+        'LOGGER': 'tests.access',
+        'SAMPLE_RATE': 1.0,
+        'ROUTES': {'/api/quiet/': 0.0},
+        'LOG_BODIES': True,
+        'MAX_BODY_BYTES': 100,
+    }
+    statuses = {'/api/quiet/ok/': 200, '/api/quiet/boom/': 500}
+
+    def view(request):
+        return HttpResponse(
+            '{"access_token": "abc"}',
+            status=statuses.get(request.path, 200),
+            content_type='application/json',
+        )
+
+    middleware = AccessLogMiddleware(view)
+    factory = RequestFactory()
+    with caplog.at_level('INFO', logger='tests.access'):
+        middleware(
+            factory.post(
+                '/api/login/',
+                '{"password": "hunter2"}',
+                content_type='application/json',
+            ),
+        )
+        middleware(
+            factory.post('/api/upload/', {'photo': ContentFile(b'x' * 10)}),
+        )
+        middleware(factory.get('/api/quiet/ok/'))
+        middleware(factory.get('/api/quiet/boom/'))
+
+    login, upload, boom = caplog.records
+    assert str(login.request_body) == '{"password": ******}'
+    assert 'abc' not in str(login.response_body)
+    assert login.status == 200 and login.duration_ms >= 0
+    assert upload.request_body is None
+    assert upload.request_bytes > 0
+    assert boom.path == '/api/quiet/boom/' and boom.status == 500
+
+
+@pytest.mark.django_db
+def test_metrics_record_views_and_tasks(api_client, user, settings):
+    from prometheus_client import REGISTRY
+
+    from users.tasks import deactivate_inactive_users
+
+    def sample(metric, kind, name):
+        labels = {'kind': kind, 'name': name}
+        return REGISTRY.get_sample_value(metric, labels) or 0
+
+    view = 'dialogs-list'
+    task = 'users.tasks.deactivate_inactive_users'
+    views = sample('hobbymate_duration_seconds_count', 'view', view)
+    queries = sample('hobbymate_db_queries_sum', 'view', view)
+    tasks = sample('hobbymate_db_queries_count', 'task', task)
+
+    api_client.force_authenticate(user)
+    api_client.get(reverse('dialog-list'))
+    deactivate_inactive_users.apply()
+
+    assert (
+        sample('hobbymate_duration_seconds_count', 'view', view) == views + 1
+    )
+    assert sample('hobbymate_db_queries_sum', 'view', view) > queries
+    assert sample('hobbymate_db_queries_count', 'task', task) == tasks + 1
+
+    settings.METRICS_TOKEN = ''
+    assert api_client.get('/metrics/').status_code == 404
+    settings.METRICS_TOKEN = 's3cret'
+    assert api_client.get('/metrics/').status_code == 403
+    resp = api_client.get('/metrics/', HTTP_AUTHORIZATION='Bearer s3cret')
+    assert resp.status_code == status.HTTP_200_OK
+    assert b'hobbymate_db_queries_bucket' in resp.content
+
+
+def test_metrics_instrument_keeps_channel_layer_async():
+    import asyncio
+    import warnings
+
+    from asgiref.sync import async_to_sync
+    from channels_redis.core import RedisChannelLayer
+
+    from helper import metrics
+
+    metrics.instrument()
+    assert asyncio.iscoroutinefunction(RedisChannelLayer.group_send)
+    assert asyncio.iscoroutinefunction(RedisChannelLayer.send)
+
+    async def group_send(group, message):
+        return group
+
+    counted = metrics._counted(group_send, 'channel_sends')
+    recorder = metrics.Recorder()
+    token = metrics._current.set(recorder)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            assert async_to_sync(counted)('g', {}) == 'g'
+    finally:
+        metrics._current.reset(token)
+    assert recorder.channel_sends == 1
+
+
+def test_jwks_manager_single_flights_refresh(settings):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    import jwt
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from django.core.cache import cache
+    from jwt.algorithms import RSAAlgorithm
+
+    from helper.jwks import JWKSKeyManager
+
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+    cache.clear()
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(private.public_key()))
+    body = json.dumps({'keys': [{**jwk, 'kid': 'k1', 'use': 'sig'}]})
+    hits = []
+
+    class StubJWKS(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            hits.append(self.path)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), StubJWKS)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/certs'
+    token = jwt.encode({'sub': 'x'}, private, 'RS256', headers={'kid': 'k1'})
+    forged = jwt.encode({'sub': 'x'}, private, 'RS256', headers={'kid': 'k2'})
+    first = JWKSKeyManager(url, refresh_interval=3600, min_interval=60)
+    second = JWKSKeyManager(url, refresh_interval=3600, min_interval=60)
+    try:
+        key = first.get_signing_key(token).key
+        assert jwt.decode(token, key, algorithms=['RS256']) == {'sub': 'x'}
+        for _ in range(5):
+            with pytest.raises(jwt.InvalidTokenError):
+                first.get_signing_key(forged)
+        assert second.get_signing_key(token).key_id == 'k1'
+        assert hits == ['/certs']
+    finally:
+        first.stop()
+        second.stop()
+        server.shutdown()
+        server.server_close()
+
+
 @pytest.mark.django_db
 def test_profile_me_get(api_client, user):
     api_client.force_authenticate(user)
@@ -247,6 +504,8 @@ def test_match_swipe_like_and_reciprocal(api_client, user_with_vector, user2):
     dialog_id = resp2.data['dialog_id']
     assert Dialog.objects.filter(id=dialog_id).exists()
     assert Notification.objects.filter(dialog_id=dialog_id).count() == 2
+    low, high = sorted((user_with_vector.id, user2.id))
+    assert MutualLike.objects.filter(user_id=low, partner_id=high).exists()
 
 
 @pytest.mark.django_db
@@ -339,6 +598,146 @@ def test_dialog_messages_get(api_client, user, user2):
     assert len(resp.data) == 2
 
 
+@pytest.mark.django_db
+def test_dialog_messages_keyset_pages(api_client, user, user2):
+    import re
+
+    from dialogs.history import InvalidPage, decode_cursor
+
+    dialog = Dialog.objects.create()
+    dialog.list_users.set([user, user2])
+    for i in range(5):
+        Message.objects.create(sender=user, text=f'm{i}', dialog=dialog)
+    api_client.force_authenticate(user)
+    url = reverse('dialog-messages', args=[dialog.id])
+
+    latest = api_client.get(url, {'limit': 2})
+    assert [m['text'] for m in latest.data] == ['m3', 'm4']
+    links = dict(
+        (rel, link)
+        for link, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', latest['Link'])
+    )
+    assert set(links) == {'prev'}
+
+    older = api_client.get(links['prev'])
+    assert [m['text'] for m in older.data] == ['m1', 'm2']
+    assert 'rel="next"' in older['Link']
+    assert 'rel="prev"' in older['Link']
+
+    assert api_client.get(url, {'before': 'nope'}).status_code == 400
+    for cursor in (123, ['x'], {'x': 1}):
+        with pytest.raises(InvalidPage):
+            decode_cursor(cursor)
+    assert len(api_client.get(url, {'limit': 500}).data) == 5
+
+
+@pytest.mark.django_db(transaction=True)
+def test_chat_consumer_serves_members_only(user, user2, admin):
+    from asgiref.sync import async_to_sync
+    from channels import DEFAULT_CHANNEL_LAYER
+    from channels.layers import InMemoryChannelLayer, channel_layers
+    from channels.routing import URLRouter
+    from django.contrib.auth.models import AnonymousUser
+
+    from dialogs.management.commands.ws_load import Client
+    from dialogs.routing import websocket_urlpatterns
+
+    dialog = Dialog.objects.create()
+    dialog.list_users.set([user, user2])
+    Message.objects.create(sender=user, text='secret', dialog=dialog)
+    app = URLRouter(websocket_urlpatterns)
+    path = f'/ws/dialogs/{dialog.id}/'
+
+    async def scenario():
+        accepted = []
+        for who in (AnonymousUser(), admin):
+            outsider = Client(app, path, who)
+            accepted.append(await outsider.connect())
+            await outsider.disconnect()
+        member = Client(app, path, user2)
+        accepted.append(await member.connect())
+        await member.send_json({'type': 'history', 'before': 123})
+        error = await member.receive_json()
+        await member.send_json({'type': 'history'})
+        page = await member.receive_json()
+        await member.disconnect()
+        return accepted, error, page
+
+    previous = channel_layers.set(
+        DEFAULT_CHANNEL_LAYER,
+        InMemoryChannelLayer(),
+    )
+    try:
+        accepted, error, page = async_to_sync(scenario)()
+    finally:
+        channel_layers.set(DEFAULT_CHANNEL_LAYER, previous)
+
+    assert accepted == [False, False, True]
+    assert error == {'type': 'error', 'detail': 'bad cursor'}
+    assert [m['text'] for m in page['messages']] == ['secret']
+
+
+@pytest.mark.django_db
+def test_dialog_inbox_orders_by_activity(
+    api_client,
+    user,
+    user2,
+    admin,
+    django_assert_max_num_queries,
+):
+    from dialogs.models import GroupChat
+
+    quiet = Dialog.objects.create()
+    quiet.list_users.set([user, user2])
+    busy = Dialog.objects.create()
+    busy.list_users.set([user, admin])
+    chat = GroupChat.objects.create(group=CustomGroup.objects.create(name='G'))
+    chat.list_users.set([user, user2, admin])
+    for sender, text, dialog in [(user, 'old', quiet), (admin, 'new', busy)]:
+        last = Message.objects.create(sender=sender, text=text, dialog=dialog)
+        DialogMembership.record_message(last)
+    api_client.force_authenticate(user)
+    url = reverse('dialog-list')
+
+    with django_assert_max_num_queries(4):
+        resp = api_client.get(url, {'limit': 2})
+
+    assert [d['id'] for d in resp.data] == [busy.id, quiet.id]
+    assert resp.data[0]['partner']['id'] == admin.id
+    assert resp.data[0]['last_message']['id'] == last.id
+    assert resp.data[0]['unread_count'] == 1
+    assert resp.data[1]['unread_count'] == 0
+    tail = api_client.get(resp['Link'].split('>')[0][1:])
+    assert [d['id'] for d in tail.data] == [chat.id]
+    assert tail.data[0]['group_name'] == 'G'
+    assert tail.data[0]['last_message'] is None
+
+
+@pytest.mark.django_db
+def test_dialog_read_state_tracks_messages(api_client, user, user2):
+    dialog = Dialog.objects.create()
+    dialog.list_users.set([user, user2])
+    api_client.force_authenticate(user2)
+    url = reverse('dialog-messages', args=[dialog.id])
+    api_client.post(url, {'text': 'one'}, format='json')
+    api_client.post(url, {'text': 'two'}, format='json')
+    last = Message.objects.latest('id')
+
+    mine = DialogMembership.objects.get(dialog=dialog, user=user)
+    theirs = DialogMembership.objects.get(dialog=dialog, user=user2)
+    assert mine.unread_count == 2
+    assert mine.last_read_message_id is None
+    assert theirs.unread_count == 0
+    assert theirs.last_read_message_id == last.id
+    assert mine.last_activity_at == last.created_at
+
+    api_client.force_authenticate(user)
+    resp = api_client.post(reverse('dialog-read', args=[dialog.id]))
+    assert resp.status_code == status.HTTP_200_OK
+    mine.refresh_from_db()
+    assert (mine.unread_count, mine.last_read_message_id) == (0, last.id)
+
+
 @pytest.mark.django_db
 def test_match_list_requires_interest_vector(api_client, user):
     api_client.force_authenticate(user)
@@ -360,6 +759,496 @@ def test_match_list_with_vector(api_client, user_with_vector, user2):
     assert resp.status_code == status.HTTP_200_OK
 
 
+@pytest.mark.django_db
+def test_find_candidates_matches_python_similarity(user, user2):
+    from dialogs.find import find_candidates
+    from dialogs.utils import similarity
+
+    user.interest_vector = [5, 1, 4, 2, 3] * 3
+    user.save()
+    vectors = {
+        'c1': [5, 1, 4, 2, 3] * 3,
+        'c2': [1, 5, 2, 4, 3] * 3,
+        'c3': [4, 2, 4, 2, 2] * 3,
+    }
+    for name, vec in vectors.items():
+        CustomUser.objects.create_user(
+            username=name,
+            password='secret',
+            interest_vector=vec,
+        )
+    Rejected.objects.create(user=user, rejected_user=user2, reason='skip')
+
+    found = find_candidates(user, limit=10)
+
+    expected = sorted(
+        vectors,
+        key=lambda n: similarity(user.interest_vector, vectors[n]),
+        reverse=True,
+    )
+    assert [c.username for c in found] == expected
+    for c in found:
+        assert c.score == pytest.approx(
+            similarity(user.interest_vector, vectors[c.username]),
+            abs=1e-4,
+        )
+
+
+@pytest.mark.django_db
+def test_match_list_served_from_pool(
+    api_client,
+    user_with_vector,
+    user2,
+    monkeypatch,
+):
+    from types import SimpleNamespace
+
+    from api import views
+    from dialogs import pool
+
+    carol = CustomUser.objects.create_user(username='carol', password='x')
+    dave = CustomUser.objects.create_user(username='dave', password='x')
+    Liked.objects.create(user=user_with_vector, liked_user=user2)
+    key = pool.pool_key(user_with_vector.id)
+    pool.redis_cli.delete(f'cand:refresh:{user_with_vector.id}')
+    pool.store_pool(
+        user_with_vector.id,
+        [
+            SimpleNamespace(id=user2.id, score=0.9),
+            SimpleNamespace(id=carol.id, score=0.8),
+        ],
+    )
+    refreshed = []
+    monkeypatch.setattr(
+        views,
+        'refresh_candidate_cache',
+        SimpleNamespace(delay=refreshed.append),
+    )
+    monkeypatch.setattr(
+        views,
+        'find_candidates',
+        lambda *a, **kw: pytest.fail('live search used'),
+    )
+    try:
+        api_client.force_authenticate(user_with_vector)
+        resp = api_client.get(reverse('match-list'))
+        assert resp.status_code == status.HTTP_200_OK
+        assert [c['id'] for c in resp.data] == [carol.id]
+        assert pool.load_pool(user_with_vector.id) == []
+        assert refreshed == [user_with_vector.id]
+
+        pool.store_pool(
+            user_with_vector.id,
+            [
+                SimpleNamespace(id=carol.id, score=0.7),
+                SimpleNamespace(id=dave.id, score=0.6),
+            ],
+        )
+        served, remaining = pool.take_from_pool(user_with_vector, limit=1)
+        assert [c.id for c in served] == [carol.id]
+        assert remaining == 1
+        assert pool.load_pool(user_with_vector.id) == [[dave.id, 0.6]]
+    finally:
+        pool.redis_cli.delete(key)
+
+
+@pytest.mark.django_db
+def test_grouping_rescans_only_changed_neighbourhoods():
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from dialogs.grouping import (
+        build_local_graph,
+        changed_users,
+        cliques_around,
+    )
+
+    a, b, c, d, e = (
+        CustomUser.objects.create_user(username=f'g{i}', password='x').id
+        for i in range(5)
+    )
+    for x, y in [(a, b), (a, c), (b, c), (d, e)]:
+        MutualLike.link(y, x)
+    MutualLike.objects.update(created_at=timezone.now() - timedelta(days=1))
+    MutualLike.link(c, d)
+    since = timezone.now() - timedelta(hours=1)
+
+    touched = changed_users(since)
+    g = build_local_graph(touched)
+
+    assert touched == {c, d}
+    assert set(g.nodes) == {a, b, c, d, e}
+    assert not g.has_edge(a, e)
+    cliques = {frozenset(q) for q in cliques_around(g, touched)}
+    assert cliques == {
+        frozenset({a, b, c}),
+        frozenset({c, d}),
+        frozenset({d, e}),
+    }
+
+
+@pytest.mark.django_db
+def test_full_and_local_graphs_share_mutual_edges():
+    from dialogs.grouping import build_graph, build_local_graph
+
+    a, b, c, d = (
+        CustomUser.objects.create_user(
+            username=f'e{i}',
+            password='x',
+            city_name=' Kazan',
+        )
+        for i in range(4)
+    )
+    for x, y in [(a, b), (b, c), (c, d)]:
+        MutualLike.link(x.id, y.id)
+    Liked.objects.create(user=a, liked_user=c)
+    Liked.objects.create(user=c, liked_user=a)
+    d.is_active = False
+    d.save(update_fields=['is_active'])
+
+    def edges(g):
+        return {frozenset(edge) for edge in g.edges}
+
+    expected = {frozenset({a.id, b.id}), frozenset({b.id, c.id})}
+    ids = [a.id, b.id, c.id]
+    assert edges(build_graph()) == expected
+    assert edges(build_graph('kazan')) == expected
+    assert edges(build_local_graph(ids)) == expected
+    assert edges(build_local_graph(ids, 'kazan')) == expected
+
+
+@pytest.mark.django_db
+def test_materialize_groups_batches_inserts_and_fanout(
+    monkeypatch,
+    django_capture_on_commit_callbacks,
+):
+    from custom_groups.models import members_signature
+    from dialogs import grouping
+
+    sent = []
+    monkeypatch.setattr(grouping, 'broadcast', sent.append)
+    ids = [
+        CustomUser.objects.create_user(username=f'm{i}', password='x').id
+        for i in range(6)
+    ]
+    chunks = [ids[:5], list(reversed(ids[:5])), ids[1:]]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        groups = grouping.materialize_groups(chunks)
+
+    assert len(groups) == 2
+    signature = members_signature(ids[:5])
+    first = CustomGroup.objects.get(member_signature=signature)
+    assert sorted(first.members.values_list('user_id', flat=True)) == ids[:5]
+    chat = first.group_chats.get()
+    assert chat.list_users.count() == 5
+    assert Notification.objects.filter(dialog=chat).count() == 5
+    assert len(sent) == 1 and len(sent[0]) == 10
+    assert {group for group, _ in sent[0]} == {f'user_{uid}' for uid in ids}
+
+    assert grouping.materialize_groups(chunks) == []
+    assert CustomGroup.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_group_member_changes_keep_signature_current(user, user2):
+    from custom_groups.models import members_signature
+
+    group = CustomGroup.objects.create(name='Signed')
+    twin = CustomGroup.objects.create(name='Twin')
+    GroupMember.objects.create(group=group, user=user)
+    member = GroupMember.objects.create(group=group, user=user2)
+    group.refresh_from_db()
+    assert group.member_signature == members_signature([user2.id, user.id])
+
+    GroupMember.objects.create(group=twin, user=user)
+    member.delete()
+    group.refresh_from_db()
+    twin.refresh_from_db()
+    assert twin.member_signature == members_signature([user.id])
+    assert group.member_signature is None
+
+
+@pytest.mark.django_db
+def test_group_delete_skips_signature_sync(user, user2):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    group = CustomGroup.objects.create(name='Doomed')
+    GroupMember.objects.create(group=group, user=user)
+    GroupMember.objects.create(group=group, user=user2)
+
+    with CaptureQueriesContext(connection) as ctx:
+        group.delete()
+    assert not [q for q in ctx.captured_queries if 'signature' in q['sql']]
+    assert not GroupMember.objects.filter(user__in=[user, user2]).exists()
+
+
+def test_clique_engine_splits_by_strictest_minimum():
+    import time
+
+    import networkx as nx
+
+    from dialogs.engines import CliqueEngine, GroupingEngine
+
+    with pytest.raises(TypeError):
+        GroupingEngine(time_budget=1)
+
+    engine = CliqueEngine(time_budget=1)
+    engine.deadline = time.monotonic() + 1
+    engine.prefs = {uid: [2, 4, 1] for uid in range(6)}
+    engine.prefs[0][0] = 3
+    chunks = list(engine.propose(nx.complete_graph(6), None))
+    assert chunks == [[0, 1, 2, 3]]
+
+
+@pytest.mark.django_db
+def test_greedy_engine_respects_size_and_group_limits():
+    from dialogs.engines import GreedyPackingEngine
+    from dialogs.grouping import build_local_graph
+
+    users = [
+        CustomUser.objects.create_user(username=f'p{i}', password='x')
+        for i in range(6)
+    ]
+    ids = [u.id for u in users]
+    for i, x in enumerate(ids):
+        for y in ids[i + 1 :]:
+            MutualLike.link(x, y)
+    CustomUser.objects.filter(id=ids[0]).update(max_group_size=5)
+    busy = CustomGroup.objects.create(name='Busy')
+    GroupMember.objects.create(group=busy, user=users[1])
+    g = build_local_graph(ids)
+
+    assert GreedyPackingEngine(time_budget=5).run(g) == [
+        [ids[0], *ids[2:]],
+    ]
+    assert GreedyPackingEngine(time_budget=0).run(g) == []
+
+
+@pytest.mark.django_db
+def test_grouping_runs_per_city_cell():
+    from dialogs.grouping import build_cell_groups, plan_cells
+
+    ids = [
+        CustomUser.objects.create_user(
+            username=f'c{i}',
+            password='x',
+            city_name='Perm' if i == 5 else ' kazan',
+        ).id
+        for i in range(6)
+    ]
+    for i, x in enumerate(ids[:5]):
+        for y in ids[i + 1 :]:
+            MutualLike.link(x, y)
+
+    assert plan_cells(full=True) == {'kazan': None, 'perm': None}
+    assert build_cell_groups('perm') == 0
+    assert build_cell_groups('kazan', seeds=[ids[0]]) == 1
+    group = CustomGroup.objects.get()
+    assert sorted(group.members.values_list('user_id', flat=True)) == ids[:5]
+
+
+@pytest.mark.django_db
+def test_persist_message_in_group_chat_uses_cached_context(
+    django_assert_max_num_queries,
+    monkeypatch,
+):
+    from dialogs import tasks
+    from dialogs.consumers import load_dialog_context, persist_message
+    from dialogs.models import GroupChat
+    from dialogs.notifications import pending_key, push_cli, push_key
+
+    members = [
+        CustomUser.objects.create_user(username=f'w{i}', password='x')
+        for i in range(7)
+    ]
+    group = CustomGroup.objects.create(name='Hikers')
+    chat = GroupChat.objects.create(group=group)
+    chat.list_users.set(members)
+    sender = members[0]
+    context = load_dialog_context(str(chat.id), sender.id)
+    scheduled = []
+    monkeypatch.setattr(
+        tasks.flush_push,
+        'apply_async',
+        lambda args, countdown, **options: scheduled.append((args, countdown)),
+    )
+    sent = []
+    monkeypatch.setattr(tasks, 'broadcast', sent.extend)
+
+    with django_assert_max_num_queries(6):
+        msg, events = persist_message(str(chat.id), sender, 'hi', context)
+
+    assert chat.messages.get() == msg
+    unread = dict(chat.memberships.values_list('user_id', 'unread_count'))
+    assert unread == {u.id: int(u != sender) for u in members}
+    assert sorted(group for group, _ in events) == sorted(
+        f'user_{u.id}' for u in members[1:]
+    )
+    assert 'Hikers' in events[0][1]['payload']['text']
+
+    persist_message(str(chat.id), sender, 'again', context)
+    _, events = persist_message(str(chat.id), sender, 'more', context)
+    assert events == []
+    rows = Notification.objects.filter(dialog=chat)
+    assert rows.count() == 6
+    assert {(n.count, n.text[-4:]) for n in rows} == {(3, 'more')}
+    assert sorted(args for args, _ in scheduled) == sorted(
+        (u.id, str(chat.id)) for u in members[1:]
+    )
+    assert all(0 < countdown <= 3 for _, countdown in scheduled)
+
+    for args, _ in scheduled:
+        tasks.flush_push(*args)
+    tasks.flush_push(*scheduled[0][0])
+    assert len(sent) == 6
+    assert {event['payload']['count'] for _, event in sent} == {3}
+    assert sent[0][1]['payload']['text'].endswith('more')
+    push_cli.delete(
+        *(push_key(u.id, str(chat.id)) for u in members[1:]),
+        *(pending_key(u.id, str(chat.id)) for u in members[1:]),
+    )
+
+
+@pytest.mark.django_db
+def test_persist_message_reply_creates_match_once(user, user2, monkeypatch):
+    from kombu.exceptions import OperationalError
+
+    from dialogs import tasks
+    from dialogs.consumers import load_dialog_context, persist_message
+    from dialogs.notifications import pending_key, push_cli, push_key
+
+    dialog = Dialog.objects.create()
+    dialog.list_users.set([user, user2])
+    Liked.objects.create(user=user2, liked_user=user)
+    context = load_dialog_context(str(dialog.id), user.id)
+
+    def broker_down(args, countdown, **options):
+        raise OperationalError('broker unavailable')
+
+    monkeypatch.setattr(tasks.flush_push, 'apply_async', broker_down)
+
+    _, events = persist_message(str(dialog.id), user, 'hey', context)
+    assert MutualLike.objects.count() == 1
+    assert len(events) == 3
+    msg, events = persist_message(str(dialog.id), user, 'again', context)
+    assert events == []
+    assert Message.objects.filter(pk=msg.pk, text='again').exists()
+    assert Liked.objects.filter(user=user, liked_user=user2).count() == 1
+    push_cli.delete(
+        push_key(user2.id, str(dialog.id)),
+        pending_key(user2.id, str(dialog.id)),
+    )
+
+
+@pytest.mark.django_db
+def test_unread_batch_replays_with_partner_in_constant_queries(
+    user,
+    user2,
+    django_assert_num_queries,
+):
+    from dialogs.notifications import mark_read, unread_batch
+
+    for i in range(3):
+        dialog = Dialog.objects.create()
+        dialog.list_users.set([user, user2])
+        Notification.objects.create(user=user, dialog=dialog, text=f'n{i}')
+
+    with django_assert_num_queries(2):
+        items, more = unread_batch(user.id, limit=2)
+    assert more is True
+    assert [i['text'] for i in items] == ['n2', 'n1']
+    assert {i['from'] for i in items} == {user2.id}
+
+    assert mark_read([i['id'] for i in items]) == 2
+    items, more = unread_batch(user.id, limit=2)
+    assert more is False
+    assert [i['text'] for i in items] == ['n0']
+
+
+@pytest.mark.django_db
+def test_generate_dataset_builds_consistent_graph():
+    import io
+
+    from django.core.management import call_command
+
+    out = io.StringIO()
+    call_command(
+        'generate_dataset',
+        users=200,
+        likes_per_user=8,
+        cities=3,
+        group_share=0.5,
+        unread_share=0.5,
+        stdout=out,
+    )
+
+    users = CustomUser.objects.filter(username__startswith='gen_')
+    assert users.count() == 200
+    assert not users.filter(interest_vector__isnull=True).exists()
+    assert users.values('city_name').distinct().count() == 3
+    for pair in MutualLike.objects.all()[:20]:
+        assert Liked.objects.filter(
+            user=pair.partner,
+            liked_user=pair.user,
+        ).exists()
+    assert GroupMember.objects.filter(user__in=users).exists()
+    unread = DialogMembership.objects.filter(unread_count__gt=0)
+    assert unread.count() == Notification.objects.filter(read=False).count()
+    assert Message.objects.filter(sender__in=users).exists()
+    assert 'dialogs:' in out.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_ws_load_delivers_every_message(tmp_path):
+    import io
+    import json
+
+    from django.core.management import call_command
+
+    report = tmp_path / 'ws_load.json'
+    call_command(
+        'ws_load',
+        sizes='2,3',
+        chats=2,
+        messages=3,
+        rate=0,
+        timeout=10,
+        json=str(report),
+        stdout=io.StringIO(),
+    )
+
+    results = json.loads(report.read_text(encoding='utf-8'))['results']
+    assert set(results) == {'chat_2', 'chat_3'}
+    assert results['chat_2']['expected'] == 2 * 3 * 1
+    assert results['chat_3']['expected'] == 2 * 3 * 2
+    for row in results.values():
+        assert row['deliveries'] == row['expected']
+        assert row['queries_per_msg'] > 0
+        assert 'p95' in row['latency_ms']
+    assert not CustomUser.objects.filter(username__startswith='load_').exists()
+    assert not Dialog.objects.exists()
+
+
+def test_similarity_batch_scores_every_row():
+    import numpy as np
+
+    from dialogs.utils import similarity_batch
+
+    me = [5, 1, 4, 2, 3] * 3
+    rows = [me, [3] * 15, [1, 5, 2, 4, 3] * 3]
+    scores = similarity_batch(me, rows, alpha=0.5)
+
+    spread = np.linalg.norm(np.array(me) - 3) / np.sqrt(15)
+    assert scores.shape == (3,)
+    assert scores[0] == pytest.approx(1.0)
+    assert scores[1] == pytest.approx(0.5 * (1 - spread))
+    assert scores[2] < scores[1] < scores[0]
+    assert similarity_batch(me, []).shape == (0,)
+
+
 @pytest.mark.django_db
 def test_interest_models():
     from interests.models import Interest, UserInterestRating
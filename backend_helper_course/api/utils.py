@@ -1,6 +1,7 @@
 import numpy as np
 from django.db import models
 
+from dialogs.utils import as_matrix
 from interests.models import Interest, UserInterestRating
 
 
@@ -23,19 +24,10 @@ NUM_INTERESTS = 15
 
 
 def build_intro_message(initiator, target):
-    vec1 = (
-        list(initiator.interest_vector)
-        if initiator.interest_vector is not None
-        else [0] * NUM_INTERESTS
+    v1, v2 = as_matrix(
+        [initiator.interest_vector, target.interest_vector],
+        NUM_INTERESTS,
     )
-    vec2 = (
-        list(target.interest_vector)
-        if target.interest_vector is not None
-        else [0] * NUM_INTERESTS
-    )
-
-    v1 = np.array(vec1, dtype=float)
-    v2 = np.array(vec2, dtype=float)
 
     top_idx = np.argsort(np.abs(v1 - v2))[:3]
     names = (
@@ -3,6 +3,13 @@ import logging
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.db import transaction
+from django.db.models import (
+    Count,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    prefetch_related_objects,
+)
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import (
     OpenApiParameter,
@@ -17,14 +24,35 @@ from rest_framework.decorators import action
 from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.viewsets import ViewSet
 
 from custom_groups.models import CustomGroup, GroupMember
 from dialogs.find import find_candidates
-from dialogs.models import Dialog, Message, Notification
+from dialogs.history import (
+    InvalidPage,
+    encode_cursor,
+    message_page,
+    message_payload,
+    parse_limit,
+)
+from dialogs.inbox import inbox_page, inbox_queryset
+from dialogs.models import (
+    Dialog,
+    DialogMembership,
+    GroupChat,
+    Message,
+    Notification,
+)
+from dialogs.pool import (
+    POOL_LOW_WATERMARK,
+    claim_refresh,
+    take_from_pool,
+)
 from dialogs.tasks import refresh_candidate_cache
 from feedback.models import Feedback
-from users.models import CustomUser, Liked, Rejected
+from interests.models import UserInterestRating
+from users.models import CustomUser, Liked, MutualLike, Rejected
 
 from .serializers import (
     CustomGroupSerializer,
@@ -41,6 +69,11 @@ from .utils import build_intro_message
 channel_layer = get_channel_layer()
 logger = logging.getLogger(__name__)
 
+RATINGS = Prefetch(
+    'interests_ratings',
+    queryset=UserInterestRating.objects.select_related('interest'),
+)
+
 
 class HelloOutSerializer(drf_serializers.Serializer):
     message = drf_serializers.CharField()
@@ -101,7 +134,7 @@ class ProfileViewSet(
     mixins.UpdateModelMixin,
     viewsets.GenericViewSet,
 ):
-    queryset = CustomUser.objects.all()
+    queryset = CustomUser.objects.prefetch_related(RATINGS)
     serializer_class = ProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [JSONParser, FormParser, MultiPartParser]
@@ -116,7 +149,9 @@ class ProfileViewSet(
 
     def get_object(self):
         if self.action == 'me':
-            return self.request.user
+            user = self.request.user
+            prefetch_related_objects([user], RATINGS)
+            return user
         return super().get_object()
 
 
@@ -148,10 +183,17 @@ class GroupViewSet(
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
+        mine = GroupMember.objects.filter(
+            user=self.request.user,
+            is_active=True,
+        )
+        chats = GroupChat.objects.filter(group=OuterRef('pk')).order_by('pk')
         return CustomGroup.objects.filter(
-            members__user=self.request.user,
-            members__is_active=True,
-        ).distinct()
+            id__in=mine.values('group_id'),
+        ).annotate(
+            members_total=Count('members'),
+            chat_pk=Subquery(chats.values('pk')[:1]),
+        )
 
     def update(self, request, *args, **kwargs):
         group = self.get_object()
@@ -216,6 +258,30 @@ class InteractionsViewSet(viewsets.ViewSet):
         return Response({'status': 'ok'})
 
 
+INBOX_PARAMETERS = [
+    OpenApiParameter(
+        'before',
+        OpenApiTypes.STR,
+        description='Курсор: диалоги с более ранней активностью',
+    ),
+    OpenApiParameter(
+        'limit',
+        OpenApiTypes.INT,
+        description='Размер страницы (по умолчанию 50, максимум 100)',
+    ),
+]
+
+
+def page_link(request, rel, limit, **cursor):
+    url = request.build_absolute_uri()
+    for key in ('before', 'after'):
+        url = remove_query_param(url, key)
+    url = replace_query_param(url, 'limit', limit)
+    for key, value in cursor.items():
+        url = replace_query_param(url, key, value)
+    return f'<{url}>; rel="{rel}"'
+
+
 @extend_schema_view(
     retrieve=extend_schema(
         parameters=[
@@ -234,9 +300,29 @@ class DialogViewSet(
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
+        if self.action in ('list', 'me', 'retrieve'):
+            return inbox_queryset(self.request.user)
         return Dialog.objects.filter(
             list_users=self.request.user,
-        ).prefetch_related('groupchat', 'list_users')
+        ).select_related('groupchat__group')
+
+    @extend_schema(parameters=INBOX_PARAMETERS)
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        try:
+            limit = parse_limit(params.get('limit'))
+            dialogs, has_more = inbox_page(
+                request.user,
+                before=params.get('before'),
+                limit=limit,
+            )
+        except InvalidPage:
+            return Response({'detail': 'Некорректный курсор'}, status=400)
+        response = Response(self.get_serializer(dialogs, many=True).data)
+        if has_more:
+            last = encode_cursor(dialogs[-1].last_activity_at, dialogs[-1].id)
+            response['Link'] = page_link(request, 'next', limit, before=last)
+        return response
 
     def create(self, request, *args, **kwargs):
         partner_id = request.data.get('partner')
@@ -263,30 +349,23 @@ class DialogViewSet(
                     user=request.user,
                     liked_user=partner,
                 )
+                if Liked.objects.filter(
+                    user=partner,
+                    liked_user=request.user,
+                ).exists():
+                    MutualLike.link(request.user.id, partner.id)
 
                 txt = build_intro_message(request.user, partner)
-                msg = Message.objects.create(sender=request.user, text=txt)
-                dialog.messages.add(msg)
-
-                payload = {
-                    'id': msg.id,
-                    'sender': request.user.id,
-                    'sender_id': request.user.id,
-                    'sender_name': request.user.username,
-                    'sender_first_name': request.user.first_name or '',
-                    'sender_last_name': request.user.last_name or '',
-                    'sender_avatar': (
-                        request.user.profile_photo.url
-                        if request.user.profile_photo
-                        else None
-                    ),
-                    'text': txt,
-                    'created_at': msg.created_at.isoformat(),
-                }
+                msg = Message.objects.create(
+                    sender=request.user,
+                    text=txt,
+                    dialog=dialog,
+                )
+                DialogMembership.record_message(msg)
 
                 async_to_sync(channel_layer.group_send)(
                     f'dialog_{dialog.id}',
-                    {'type': 'chat.message', 'message': payload},
+                    {'type': 'chat.message', 'message': message_payload(msg)},
                 )
 
                 Notification.objects.create(
@@ -310,7 +389,10 @@ class DialogViewSet(
         serializer = self.get_serializer(dialog)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @extend_schema(responses=DialogSerializer(many=True))
+    @extend_schema(
+        parameters=INBOX_PARAMETERS,
+        responses=DialogSerializer(many=True),
+    )
     @action(detail=False, methods=['get'])
     def me(self, request, *args, **kwargs):
         return self.list(request, *args, **kwargs)
@@ -319,6 +401,21 @@ class DialogViewSet(
         methods=['get'],
         parameters=[
             OpenApiParameter('pk', OpenApiTypes.INT, OpenApiParameter.PATH),
+            OpenApiParameter(
+                'before',
+                OpenApiTypes.STR,
+                description='Курсор: сообщения старше указанного',
+            ),
+            OpenApiParameter(
+                'after',
+                OpenApiTypes.STR,
+                description='Курсор: сообщения новее указанного',
+            ),
+            OpenApiParameter(
+                'limit',
+                OpenApiTypes.INT,
+                description='Размер страницы (по умолчанию 50, максимум 100)',
+            ),
         ],
         responses=MessageSerializer(many=True),
     )
@@ -338,11 +435,49 @@ class DialogViewSet(
             text = request.data.get('text', '').strip()
             if not text:
                 return Response({'detail': 'Пустое сообщение'}, status=400)
-            msg = Message.objects.create(sender=request.user, text=text)
-            dialog.messages.add(msg)
+            with transaction.atomic():
+                msg = Message.objects.create(
+                    sender=request.user,
+                    text=text,
+                    dialog=dialog,
+                )
+                DialogMembership.record_message(msg)
             return Response(MessageSerializer(msg).data, status=201)
-        qs = dialog.messages.order_by('created_at').select_related('sender')
-        return Response(MessageSerializer(qs, many=True).data)
+        params = request.query_params
+        try:
+            limit = parse_limit(params.get('limit'))
+            page, has_older, has_newer = message_page(
+                dialog.id,
+                before=params.get('before'),
+                after=params.get('after'),
+                limit=limit,
+            )
+        except InvalidPage:
+            return Response({'detail': 'Некорректный курсор'}, status=400)
+        response = Response(MessageSerializer(page, many=True).data)
+        links = []
+        if page and has_older:
+            first = encode_cursor(page[0].created_at, page[0].id)
+            links.append(page_link(request, 'prev', limit, before=first))
+        if page and has_newer:
+            last = encode_cursor(page[-1].created_at, page[-1].id)
+            links.append(page_link(request, 'next', limit, after=last))
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('pk', OpenApiTypes.INT, OpenApiParameter.PATH),
+        ],
+        request=None,
+        responses=StatusOKSerializer,
+    )
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        dialog = self.get_object()
+        DialogMembership.mark_read(dialog.id, request.user.id)
+        return Response({'status': 'ok'})
 
 
 channel_layer = get_channel_layer()
@@ -365,7 +500,11 @@ class MatchViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        pool = find_candidates(request.user, limit=10)
+        pool, remaining = take_from_pool(request.user, limit=10)
+        if remaining < POOL_LOW_WATERMARK and claim_refresh(request.user.id):
+            refresh_candidate_cache.delay(request.user.id)
+        if not pool:
+            pool = find_candidates(request.user, limit=10)
         if not pool:
             return Response([], status=200)
         return Response(MatchSerializer(pool, many=True).data)
@@ -391,6 +530,7 @@ class MatchViewSet(viewsets.ViewSet):
             ).exists()
 
             if reciprocal:
+                MutualLike.link(request.user.id, target.id)
                 dialog = (
                     Dialog.objects.filter(groupchat__isnull=True)
                     .filter(list_users=request.user)
@@ -404,6 +544,7 @@ class MatchViewSet(viewsets.ViewSet):
                         Notification.objects.create(
                             user_id=uid,
                             dialog=dialog,
+                            kind=Notification.MATCH,
                             text='У вас новый матч! '
                             'Откройте чат и поздоровайтесь 🙂',
                         )
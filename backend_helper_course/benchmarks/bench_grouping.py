@@ -0,0 +1,47 @@
+import pytest
+from django.db.models import Count
+
+from dialogs.grouping import build_graph, build_groups, cell_of
+from users.models import CustomUser
+
+
+def largest_cell():
+    return (
+        CustomUser.objects.annotate(cell=cell_of())
+        .values('cell')
+        .annotate(n=Count('id'))
+        .order_by('-n')
+        .values_list('cell', flat=True)
+        .first()
+    )
+
+
+@pytest.mark.django_db
+def test_build_graph(bench, dataset):
+    g = bench(
+        f'grouping.build_graph[{dataset["label"]}]',
+        build_graph,
+        users=dataset['users'],
+        spread_km=dataset['spread_km'],
+    )
+    assert g.number_of_nodes() == CustomUser.objects.count()
+    cell = largest_cell()
+    bench(
+        f'grouping.build_graph_cell[{dataset["label"]}]',
+        lambda: build_graph(cell),
+        users=dataset['users'],
+        spread_km=dataset['spread_km'],
+    )
+
+
+@pytest.mark.django_db
+def test_build_groups(bench, dataset):
+    # Повторный прогон нашёл бы уже созданные группы, поэтому меряем
+    # один проход; созданное откатится вместе с транзакцией теста.
+    bench(
+        f'grouping.build_groups[{dataset["label"]}]',
+        lambda: build_groups(full=True),
+        rounds=1,
+        users=dataset['users'],
+        spread_km=dataset['spread_km'],
+    )
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+
+from api.utils import recalc_interest_vector
+from dialogs.find import find_candidates
+from dialogs.utils import similarity, similarity_batch
+from interests.models import Interest, UserInterestRating
+from users.models import NUM_INTERESTS, CustomUser
+
+SAMPLE = int(os.getenv('BENCH_SAMPLE', 50))
+PAIRS = int(os.getenv('BENCH_PAIRS', 10_000))
+
+
+def sample_users(n):
+    ids = list(CustomUser.objects.order_by('id').values_list('id', flat=True))
+    picked = ids[:: max(len(ids) // n, 1)][:n]
+    return list(CustomUser.objects.filter(id__in=picked).order_by('id'))
+
+
+@pytest.fixture(scope='module')
+def rated_users(dataset, django_db_blocker):
+    rng = np.random.default_rng(0)
+    with django_db_blocker.unblock():
+        Interest.objects.bulk_create(
+            [
+                Interest(id=i, name=f'bench_interest_{i}')
+                for i in range(1, NUM_INTERESTS + 1)
+            ],
+            ignore_conflicts=True,
+        )
+        users = sample_users(SAMPLE)
+        UserInterestRating.objects.bulk_create(
+            [
+                UserInterestRating(
+                    user=user,
+                    interest_id=i,
+                    rating=int(rating),
+                )
+                for user in users
+                for i, rating in enumerate(
+                    rng.integers(1, 6, NUM_INTERESTS),
+                    start=1,
+                )
+            ],
+        )
+        return users
+
+
+@pytest.mark.parametrize('rows', [1_000, 100_000])
+def test_similarity(bench, rows):
+    rng = np.random.default_rng(0)
+    matrix = rng.integers(1, 6, (rows, NUM_INTERESTS)).astype(float)
+    u = matrix[0].tolist()
+    pairs = [v.tolist() for v in matrix[: min(rows, PAIRS)]]
+    bench(
+        f'matching.similarity[{len(pairs)} pairs]',
+        lambda: [similarity(u, v) for v in pairs],
+        pairs=len(pairs),
+    )
+    scores = bench(
+        f'matching.similarity_batch[{rows} rows]',
+        lambda: similarity_batch(u, matrix),
+        rows=rows,
+    )
+    assert scores.shape == (rows,)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('geo', [True, False], ids=['geo', 'vector'])
+def test_find_candidates(bench, dataset, geo):
+    users = sample_users(SAMPLE)
+    if not geo:
+        for user in users:
+            user.location = None
+    found = bench(
+        f'matching.find_candidates[{dataset["label"]}, '
+        f'{"geo" if geo else "vector"}]',
+        lambda: [len(find_candidates(user)) for user in users],
+        users=dataset['users'],
+        spread_km=dataset['spread_km'],
+        calls=len(users),
+    )
+    assert sum(found) > 0
+
+
+@pytest.mark.django_db
+def test_recalc_interest_vector(bench, dataset, rated_users):
+    def run():
+        for user in rated_users:
+            recalc_interest_vector(user)
+
+    bench(
+        f'matching.recalc_interest_vector[{dataset["label"]}]',
+        run,
+        users=dataset['users'],
+        calls=len(rated_users),
+    )
+    assert len(rated_users[0].interest_vector) == NUM_INTERESTS
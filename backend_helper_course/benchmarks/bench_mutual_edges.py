@@ -0,0 +1,111 @@
+import os
+
+import pytest
+from django.db import connection
+
+from dialogs.grouping import build_graph, iter_mutual_edges
+from users.models import Liked
+
+LIKES = int(os.getenv('BENCH_LIKES', 1_000_000))
+USERS = int(os.getenv('BENCH_USERS', max(LIKES // 50, 100)))
+RECIPROCITY = float(os.getenv('BENCH_RECIPROCITY', 0.3))
+LEGACY_SAMPLE = int(os.getenv('BENCH_LEGACY_SAMPLE', 5_000))
+
+SEED_USERS_SQL = """
+INSERT INTO users_customuser (
+    password, is_superuser, username, first_name, last_name, email,
+    is_staff, is_active, date_joined, bio, is_can_write, min_group_size,
+    max_group_size, max_simultaneous_groups, is_offline, created_at,
+    updated_at
+)
+SELECT '!', false, 'bench_' || g, '', '', '', false, true, now(), '',
+       true, 5, 7, 1, false, now(), now()
+FROM generate_series(1, %(users)s) AS g
+"""
+
+SEED_LIKES_SQL = """
+WITH u AS (
+    SELECT array_agg(id ORDER BY id) AS ids, count(*) AS n
+    FROM users_customuser WHERE username LIKE 'bench\\_%%'
+)
+INSERT INTO users_liked (user_id, liked_user_id, created_at)
+SELECT u.ids[1 + s.i], u.ids[1 + (s.i + k.k * 7919) %% u.n], now()
+FROM u
+CROSS JOIN LATERAL generate_series(0, u.n - 1) AS s(i)
+CROSS JOIN generate_series(1, %(per_user)s) AS k(k)
+WHERE (k.k * 7919) %% u.n <> 0
+ON CONFLICT DO NOTHING
+"""
+
+SEED_RECIPROCAL_SQL = """
+INSERT INTO users_liked (user_id, liked_user_id, created_at)
+SELECT liked_user_id, user_id, now()
+FROM users_liked
+WHERE random() < %(reciprocity)s
+ON CONFLICT DO NOTHING
+"""
+
+SEED_MUTUAL_SQL = """
+INSERT INTO users_mutuallike (user_id, partner_id, created_at)
+SELECT a.user_id, a.liked_user_id, now()
+FROM users_liked a
+JOIN users_liked b
+  ON b.user_id = a.liked_user_id AND b.liked_user_id = a.user_id
+WHERE a.user_id < a.liked_user_id
+ON CONFLICT DO NOTHING
+"""
+
+
+def legacy_edges(limit):
+    edges = []
+    for like in Liked.objects.select_related('user', 'liked_user')[:limit]:
+        if Liked.objects.filter(
+            user=like.liked_user,
+            liked_user=like.user,
+        ).exists():
+            edges.append((like.user_id, like.liked_user_id))
+    return edges
+
+
+@pytest.fixture(scope='module')
+def likes_dataset(django_db_setup, django_db_blocker):
+    per_user = max(round(LIKES / USERS / (1 + RECIPROCITY)), 1)
+    with django_db_blocker.unblock(), connection.cursor() as cursor:
+        cursor.execute(SEED_USERS_SQL, {'users': USERS})
+        cursor.execute(SEED_LIKES_SQL, {'per_user': per_user})
+        cursor.execute(SEED_RECIPROCAL_SQL, {'reciprocity': RECIPROCITY})
+        cursor.execute(SEED_MUTUAL_SQL)
+        cursor.execute('ANALYZE users_liked, users_mutuallike')
+        cursor.execute('SELECT count(*) FROM users_liked')
+        (likes,) = cursor.fetchone()
+        yield likes
+        cursor.execute(
+            'TRUNCATE users_liked, users_mutuallike, users_customuser CASCADE',
+        )
+
+
+@pytest.mark.django_db
+def test_stream_mutual_edges(bench, likes_dataset):
+    edges = bench(
+        'mutual_edges.stream',
+        lambda: sum(1 for _ in iter_mutual_edges()),
+        likes=likes_dataset,
+    )
+    assert edges > 0
+
+
+@pytest.mark.django_db
+def test_build_graph(bench, likes_dataset):
+    g = bench('grouping.build_graph', build_graph, likes=likes_dataset)
+    assert g.number_of_nodes() == USERS
+
+
+@pytest.mark.django_db
+def test_legacy_exists_loop(bench, likes_dataset):
+    sample = min(LEGACY_SAMPLE, likes_dataset)
+    bench(
+        'mutual_edges.legacy_loop',
+        lambda: legacy_edges(sample),
+        rounds=1,
+        likes=sample,
+    )
@@ -0,0 +1,196 @@
+import io
+import json
+import platform
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+
+from custom_groups.models import CustomGroup
+from dialogs.models import Dialog
+from users.models import CustomUser
+
+BENCH_RESULTS = pytest.StashKey[dict]()
+BENCH_REGRESSIONS = pytest.StashKey[list]()
+TIMING_FIELDS = ('min', 'mean', 'rounds')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('bench')
+    group.addoption(
+        '--bench-rounds',
+        type=int,
+        default=3,
+        help='Сколько раз прогонять каждый замер.',
+    )
+    group.addoption(
+        '--bench-sizes',
+        default='1000,10000',
+        help='Размеры датасета (число пользователей) через запятую.',
+    )
+    group.addoption(
+        '--bench-spreads',
+        default='5,50',
+        help='Разброс координат вокруг центра города в км через запятую.',
+    )
+    group.addoption(
+        '--bench-json',
+        metavar='PATH',
+        help='Сохранить результаты замеров в JSON.',
+    )
+    group.addoption(
+        '--bench-baseline',
+        metavar='PATH',
+        help='JSON прошлого прогона, с которым сравнивать результаты.',
+    )
+    group.addoption(
+        '--bench-max-regression',
+        type=float,
+        default=None,
+        help='Допустимое замедление min относительно базы (0.2 = 20%%), '
+        'при превышении прогон падает.',
+    )
+
+
+def pytest_configure(config):
+    config.stash[BENCH_RESULTS] = {}
+    config.stash[BENCH_REGRESSIONS] = []
+
+
+def split_option(config, name, cast):
+    return [cast(v) for v in config.getoption(name).split(',') if v.strip()]
+
+
+def pytest_generate_tests(metafunc):
+    if 'dataset' not in metafunc.fixturenames:
+        return
+    sizes = split_option(metafunc.config, '--bench-sizes', int)
+    spreads = split_option(metafunc.config, '--bench-spreads', float)
+    params = [(size, spread) for size in sizes for spread in spreads]
+    metafunc.parametrize(
+        'dataset',
+        params,
+        indirect=True,
+        scope='module',
+        ids=[f'{size}u-{spread:g}km' for size, spread in params],
+    )
+
+
+@pytest.fixture(scope='module')
+def dataset(request, django_db_setup, django_db_blocker):
+    users, spread_km = request.param
+    tables = ', '.join(
+        model._meta.db_table for model in (CustomUser, Dialog, CustomGroup)
+    )
+    with django_db_blocker.unblock():
+        call_command(
+            'generate_dataset',
+            users=users,
+            city_spread_km=spread_km,
+            stdout=io.StringIO(),
+        )
+        yield {
+            'label': f'{users}u/{spread_km:g}km',
+            'users': users,
+            'spread_km': spread_km,
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {tables} CASCADE')
+
+
+@pytest.fixture(autouse=True)
+def local_services(settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+    }
+    settings.CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    }
+
+
+@pytest.fixture
+def bench(request):
+    results = request.config.stash[BENCH_RESULTS]
+    default_rounds = request.config.getoption('--bench-rounds')
+
+    def run(name, fn, rounds=None, **meta):
+        timings = []
+        value = None
+        for _ in range(rounds or default_rounds):
+            start = time.perf_counter()
+            value = fn()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            'min': min(timings),
+            'mean': sum(timings) / len(timings),
+            'rounds': len(timings),
+            **meta,
+        }
+        return value
+
+    return run
+
+
+def load_baseline(config):
+    path = config.getoption('--bench-baseline')
+    if not path:
+        return {}
+    return json.loads(Path(path).read_text(encoding='utf-8'))['results']
+
+
+def pytest_sessionfinish(session, exitstatus):
+    config = session.config
+    results = config.stash.get(BENCH_RESULTS, {})
+    if not results:
+        return
+    path = config.getoption('--bench-json')
+    if path:
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.node(),
+            'results': results,
+        }
+        Path(path).write_text(
+            json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True),
+            encoding='utf-8',
+        )
+    limit = config.getoption('--bench-max-regression')
+    if limit is None:
+        return
+    baseline = load_baseline(config)
+    regressions = config.stash[BENCH_REGRESSIONS]
+    for name, row in sorted(results.items()):
+        base = baseline.get(name)
+        if base and row['min'] > base['min'] * (1 + limit):
+            regressions.append(name)
+    if regressions and session.exitstatus == pytest.ExitCode.OK:
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    results = config.stash.get(BENCH_RESULTS, {})
+    if not results:
+        return
+    baseline = load_baseline(config)
+    regressions = config.stash.get(BENCH_REGRESSIONS, [])
+    terminalreporter.section('benchmarks')
+    for name, row in sorted(results.items()):
+        extra = ', '.join(
+            f'{k}={v}' for k, v in row.items() if k not in TIMING_FIELDS
+        )
+        base = baseline.get(name)
+        if base:
+            ratio = row['min'] / base['min']
+            extra += f' base={base["min"]:.4f}s x{ratio:.2f}'
+        if name in regressions:
+            extra += ' REGRESSION'
+        terminalreporter.write_line(
+            f'{name:<45} min={row["min"]:.4f}s '
+            f'mean={row["mean"]:.4f}s x{row["rounds"]} {extra}',
+        )
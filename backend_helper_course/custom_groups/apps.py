@@ -5,3 +5,6 @@ class CustomGroupsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'custom_groups'
     verbose_name = 'Группы'
+
+    def ready(self):
+        from . import signals  # noqa: F401
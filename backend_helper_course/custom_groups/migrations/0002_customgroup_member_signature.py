@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-17 11:00
+
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+UPDATE custom_groups_customgroup g
+SET member_signature = s.signature
+FROM (
+    SELECT group_id,
+           encode(
+               sha256(
+                   convert_to(
+                       string_agg(user_id::text, ',' ORDER BY user_id),
+                       'UTF8'
+                   )
+               ),
+               'hex'
+           ) AS signature
+    FROM custom_groups_groupmember
+    GROUP BY group_id
+) s
+WHERE s.group_id = g.id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_groups', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customgroup',
+            name='member_signature',
+            field=models.CharField(
+                blank=True, db_index=True, editable=False, max_length=64
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
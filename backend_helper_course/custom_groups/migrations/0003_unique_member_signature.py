@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+SIGNATURES_SQL = """
+UPDATE custom_groups_customgroup SET member_signature = NULL;
+UPDATE custom_groups_customgroup g
+SET member_signature = s.signature
+FROM (
+    SELECT group_id,
+           encode(
+               sha256(
+                   convert_to(
+                       string_agg(user_id::text, ',' ORDER BY user_id),
+                       'UTF8'
+                   )
+               ),
+               'hex'
+           ) AS signature
+    FROM custom_groups_groupmember
+    GROUP BY group_id
+) s
+WHERE s.group_id = g.id;
+UPDATE custom_groups_customgroup g
+SET member_signature = NULL
+WHERE EXISTS (
+    SELECT 1
+    FROM custom_groups_customgroup o
+    WHERE o.member_signature = g.member_signature AND o.id < g.id
+);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('custom_groups', '0002_customgroup_member_signature'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customgroup',
+            name='member_signature',
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True
+            ),
+        ),
+        migrations.RunSQL(SIGNATURES_SQL, migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name='customgroup',
+            name='member_signature',
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                null=True,
+                unique=True,
+            ),
+        ),
+    ]
@@ -1,12 +1,26 @@
-from django.db import models
+import hashlib
+
+from django.db import IntegrityError, models, transaction
 
 from users.models import CustomUser
 
 
+def members_signature(user_ids):
+    joined = ','.join(str(uid) for uid in sorted(set(user_ids)))
+    return hashlib.sha256(joined.encode()).hexdigest()
+
+
 class CustomGroup(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    member_signature = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Группа'
@@ -16,6 +30,23 @@ class CustomGroup(models.Model):
     def __str__(self):  # pragma: no cover
         return self.name
 
+    @classmethod
+    def sync_signature(cls, group_id):
+        user_ids = list(
+            GroupMember.objects.filter(group_id=group_id).values_list(
+                'user_id',
+                flat=True,
+            ),
+        )
+        signature = members_signature(user_ids) if user_ids else None
+        try:
+            with transaction.atomic():
+                cls.objects.filter(pk=group_id).update(
+                    member_signature=signature,
+                )
+        except IntegrityError:
+            cls.objects.filter(pk=group_id).update(member_signature=None)
+
 
 class GroupMember(models.Model):
     user = models.ForeignKey(
@@ -0,0 +1,19 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CustomGroup, GroupMember
+
+
+def deleting_group(origin, group_id):
+    if isinstance(origin, CustomGroup):
+        return origin.pk == group_id
+    return isinstance(origin, QuerySet) and origin.model is CustomGroup
+
+
+@receiver(post_save, sender=GroupMember)
+@receiver(post_delete, sender=GroupMember)
+def update_member_signature(sender, instance: GroupMember, **kwargs):
+    if deleting_group(kwargs.get('origin'), instance.group_id):
+        return
+    CustomGroup.sync_signature(instance.group_id)
@@ -1,17 +1,120 @@
 import logging
 
-from asgiref.sync import async_to_sync
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import Q
+
+from users.models import Liked, MutualLike
+
+from .fanout import send_all
+from .history import (
+    InvalidPage,
+    encode_cursor,
+    message_page,
+    message_payload,
+    parse_limit,
+)
+from .models import Dialog, DialogMembership, Message, Notification
+from .notifications import (
+    add_message_notifications,
+    claim_pushes,
+    mark_read,
+    unread_batch,
+)
 
-from users.models import Liked
-
-from .models import Dialog, Message, Notification
+logger = logging.getLogger('django.channels')
 
-channel_layer = get_channel_layer()
 
-logger = logging.getLogger('django.channels')
+def load_dialog_context(dialog_id, user_id):
+    dialog = Dialog.objects.select_related('groupchat__group').get(
+        pk=dialog_id,
+    )
+    members = list(
+        dialog.list_users.values_list(
+            'id',
+            'username',
+            'first_name',
+            'last_name',
+        ),
+    )
+    others = [m for m in members if m[0] != user_id]
+    is_group = hasattr(dialog, 'groupchat')
+    if is_group:
+        title = dialog.groupchat.group.name
+    elif others:
+        _, username, first_name, last_name = others[0]
+        title = f'{first_name} {last_name}'.strip() or username
+    else:
+        title = ''
+    return {
+        'member_ids': [m[0] for m in members],
+        'recipient_ids': [m[0] for m in others],
+        'title': title,
+        'liked': is_group,
+    }
+
+
+def _notify(uid, dialog_id, text, **extra):
+    payload = {'dialog': dialog_id, 'text': text, **extra}
+    return f'user_{uid}', {'type': 'notify', 'payload': payload}
+
+
+def persist_message(dialog_id, sender, text, context):
+    notifications = []
+    events = []
+    with transaction.atomic():
+        msg = Message.objects.create(
+            sender=sender,
+            text=text,
+            dialog_id=dialog_id,
+        )
+        if not context['liked']:
+            for uid in _like_on_reply(sender.id, context):
+                notifications.append(
+                    Notification(
+                        user_id=uid,
+                        dialog_id=dialog_id,
+                        kind=Notification.MATCH,
+                        text='У вас новый матч! '
+                        'Откройте чат и поздоровайтесь 🙂',
+                    ),
+                )
+                events.append(
+                    _notify(uid, dialog_id, 'У вас новый матч! 💚'),
+                )
+        Notification.objects.bulk_create(notifications)
+        DialogMembership.record_message(msg)
+        notice = f'Новое сообщение в чате «{context["title"]}»: {text[:50]}'
+        counts = add_message_notifications(
+            dialog_id,
+            context['recipient_ids'],
+            notice,
+        )
+    for uid in claim_pushes(dialog_id, list(counts)):
+        events.append(_notify(uid, dialog_id, notice, count=counts[uid]))
+    return msg, events
+
+
+def _like_on_reply(sender_id, context):
+    users = context['member_ids']
+    context['liked'] = True
+    if len(users) != 2 or sender_id not in users:
+        return []
+    other_id = users[1] if users[0] == sender_id else users[0]
+    likers = set(
+        Liked.objects.filter(
+            Q(user_id=sender_id, liked_user_id=other_id)
+            | Q(user_id=other_id, liked_user_id=sender_id),
+        ).values_list('user_id', flat=True),
+    )
+    if sender_id in likers:
+        return []
+    Liked.objects.create(user_id=sender_id, liked_user_id=other_id)
+    if other_id not in likers:
+        return []
+    MutualLike.link(sender_id, other_id)
+    return users
 
 
 class ChatConsumer(AsyncJsonWebsocketConsumer):
@@ -24,6 +127,17 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             '[ChatConsumer] CONNECT '
             f'user={user.id!r} dialog={self.dialog_id!r}',
         )
+        try:
+            self.context = await database_sync_to_async(load_dialog_context)(
+                self.dialog_id,
+                user.id,
+            )
+        except Dialog.DoesNotExist:
+            await self.close()
+            return
+        if user.is_anonymous or user.id not in self.context['member_ids']:
+            await self.close()
+            return
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
         logger.debug('[ChatConsumer] ACCEPTED')
@@ -38,85 +152,62 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
             self.channel_name,
         )
 
-    @database_sync_to_async
-    def get_recipient_ids(self):
-        dialog = Dialog.objects.get(pk=self.dialog_id)
-        return list(
-            dialog.list_users.exclude(id=self.scope['user'].id).values_list(
-                'id',
-                flat=True,
-            ),
-        )
-
-    @database_sync_to_async
-    def get_chat_title(self):
-        from .models import Dialog
-
-        dialog = Dialog.objects.get(pk=self.dialog_id)
-        if hasattr(dialog, 'groupchat'):
-            return dialog.groupchat.group.name
-        other = dialog.list_users.exclude(id=self.scope['user'].id).first()
-        return (
-            f'{other.first_name} {other.last_name}'.strip()
-            if (other.first_name or other.last_name)
-            else other.username
-        )
-
     async def receive_json(self, content):
         logger.debug(
             f'[ChatConsumer] RECEIVE_JSON '
             f'dialog={self.dialog_id} content={content!r}',
         )
+        if content.get('type') == 'history':
+            await self.send_history(content)
+            return
         try:
-            msg = await self.create_message(content['text'])
-            await self._ensure_like_on_reply(msg.sender_id)
+            msg, events = await database_sync_to_async(persist_message)(
+                self.dialog_id,
+                self.scope['user'],
+                content['text'],
+                self.context,
+            )
         except Exception as e:
             logger.error(
                 f'[ChatConsumer] Failed to create message: {e}',
                 exc_info=True,
             )
             return
-        payload = {
-            'id': msg.id,
-            'sender': msg.sender.id,
-            'sender_id': msg.sender.id,
-            'sender_name': msg.sender.username,
-            'sender_first_name': msg.sender.first_name or '',
-            'sender_last_name': msg.sender.last_name or '',
-            'sender_avatar': (
-                msg.sender.profile_photo.url
-                if msg.sender.profile_photo
-                else None
-            ),
-            'text': msg.text,
-            'created_at': msg.created_at.isoformat(),
-        }
+        payload = message_payload(msg)
         logger.debug(f'[ChatConsumer] BROADCAST {payload}')
-        await self.channel_layer.group_send(
-            self.group_name,
-            {'type': 'chat.message', 'message': payload},
+        await send_all(
+            [
+                (
+                    self.group_name,
+                    {'type': 'chat.message', 'message': payload},
+                ),
+                *events,
+            ],
+            self.channel_layer,
         )
-        recipient_ids = await self.get_recipient_ids()
-        title = await self.get_chat_title()
-        for uid in recipient_ids:
-            await database_sync_to_async(Notification.objects.create)(
-                user_id=uid,
-                dialog_id=self.dialog_id,
-                text=f'Новое сообщение в чате «{title}»: {msg.text[:50]}',
-            )
-            await channel_layer.group_send(
-                f'user_{uid}',
-                {
-                    'type': 'notify',
-                    'payload': {
-                        'dialog': self.dialog_id,
-                        'text': (
-                            f'Новое сообщение в '
-                            f'чате «{title}»: {payload["text"][:50]}'
-                        ),
-                    },
-                },
+
+    async def send_history(self, content):
+        try:
+            limit = parse_limit(content.get('limit'))
+            page, has_older, _ = await database_sync_to_async(message_page)(
+                self.dialog_id,
+                before=content.get('before'),
+                limit=limit,
             )
+        except InvalidPage:
+            await self.send_json({'type': 'error', 'detail': 'bad cursor'})
+            return
+        await self.send_json(
+            {
+                'type': 'history',
+                'messages': [message_payload(msg) for msg in page],
+                'before': (
+                    encode_cursor(page[0].created_at, page[0].id)
+                    if page and has_older
+                    else None
+                ),
+            },
+        )
 
     async def chat_message(self, event):
         logger.debug(
@@ -124,61 +215,6 @@ class ChatConsumer(AsyncJsonWebsocketConsumer):
         )
         await self.send_json(event['message'])
 
-    @database_sync_to_async
-    def create_message(self, text):
-        msg = Message.objects.create(sender=self.scope['user'], text=text)
-        dialog = Dialog.objects.get(pk=self.dialog_id)
-        dialog.messages.add(msg)
-        return msg
-
-    @database_sync_to_async
-    def _other_participants(self):
-        dialog = Dialog.objects.get(pk=self.dialog_id)
-        return list(
-            dialog.list_users.exclude(id=self.scope['user'].id).values_list(
-                'id',
-                flat=True,
-            ),
-        )
-
-    @database_sync_to_async
-    def _ensure_like_on_reply(self, sender_id):
-        dialog = Dialog.objects.select_related('groupchat').get(
-            pk=self.dialog_id,
-        )
-        if hasattr(dialog, 'groupchat'):
-            return
-        users = list(dialog.list_users.values_list('id', flat=True))
-        if len(users) != 2 or sender_id not in users:
-            return
-        other_id = users[1] if users[0] == sender_id else users[0]
-        if Liked.objects.filter(
-            user_id=sender_id,
-            liked_user_id=other_id,
-        ).exists():
-            return
-        Liked.objects.create(user_id=sender_id, liked_user_id=other_id)
-        if Liked.objects.filter(
-            user_id=other_id,
-            liked_user_id=sender_id,
-        ).exists():
-            for uid in users:
-                Notification.objects.create(
-                    user_id=uid,
-                    dialog_id=self.dialog_id,
-                    text='У вас новый матч! Откройте чат и поздоровайтесь 🙂',
-                )
-                async_to_sync(channel_layer.group_send)(
-                    f'user_{uid}',
-                    {
-                        'type': 'notify',
-                        'payload': {
-                            'dialog': self.dialog_id,
-                            'text': 'У вас новый матч! 💚',
-                        },
-                    },
-                )
-
 
 class NotifyConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
@@ -191,10 +227,19 @@ class NotifyConsumer(AsyncJsonWebsocketConsumer):
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
         logger.debug(f'[Notify] CONNECT user={self.user.id}')
-        payloads = await self.fetch_unread_payloads()
-        for p in payloads:
-            await self.send_json(p)
-            await self._mark_read(p['id'])
+        await self.replay()
+
+    async def receive_json(self, content, **kwargs):
+        if content.get('type') == 'more':
+            await self.replay()
+
+    async def replay(self):
+        items, more = await database_sync_to_async(unread_batch)(self.user.id)
+        if items:
+            await self.send_json(
+                {'type': 'batch', 'items': items, 'more': more},
+            )
+            await database_sync_to_async(mark_read)([i['id'] for i in items])
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
@@ -204,28 +249,3 @@ class NotifyConsumer(AsyncJsonWebsocketConsumer):
 
     async def notify(self, event):
         await self.send_json(event['payload'])
-
-    @database_sync_to_async
-    def fetch_unread_payloads(self):
-        notifs = Notification.objects.filter(
-            user=self.user,
-            read=False,
-        ).select_related('dialog')
-        result = []
-        for n in notifs:
-            dialog = n.dialog
-            other = dialog.list_users.exclude(id=self.user.id).first()
-            result.append(
-                {
-                    'dialog': str(n.dialog_id),
-                    'text': n.text,
-                    'from': other.id if other else None,
-                    'id': n.id,
-                    'created_at': n.created_at.isoformat(),
-                },
-            )
-        return result
-
-    @database_sync_to_async
-    def _mark_read(self, nid):
-        Notification.objects.filter(pk=nid).update(read=True)
@@ -0,0 +1,158 @@
+import time
+from abc import ABC, abstractmethod
+
+import networkx as nx
+from django.conf import settings
+from django.db.models import Count
+
+from custom_groups.models import GroupMember
+from dialogs.grouping import cliques_around, split_clique
+from dialogs.utils import as_matrix, similarity_batch
+from users.models import NUM_INTERESTS, CustomUser
+
+
+def load_preferences(user_ids=None):
+    users = CustomUser.objects.filter(is_active=True)
+    memberships = GroupMember.objects.filter(is_active=True)
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        memberships = memberships.filter(user_id__in=user_ids)
+    busy = dict(
+        memberships.values('user_id')
+        .annotate(n=Count('id'))
+        .values_list('user_id', 'n'),
+    )
+    return {
+        uid: [min_size, max_size, limit - busy.get(uid, 0)]
+        for uid, min_size, max_size, limit in users.values_list(
+            'id',
+            'min_group_size',
+            'max_group_size',
+            'max_simultaneous_groups',
+        ).iterator()
+    }
+
+
+class GroupingEngine(ABC):
+    def __init__(self, time_budget=None):
+        if time_budget is None:
+            time_budget = settings.GROUPING_TIME_BUDGET
+        self.time_budget = time_budget
+        self.deadline = None
+        self.prefs = {}
+
+    def run(self, g, seeds=None):
+        self.deadline = time.monotonic() + self.time_budget
+        user_ids = None if seeds is None else list(g)
+        self.prefs = load_preferences(user_ids)
+        self.prepare(g, user_ids)
+        return list(self.propose(g, seeds))
+
+    def prepare(self, g, user_ids):
+        pass
+
+    @abstractmethod
+    def propose(self, g, seeds):
+        pass
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def available(self, uid):
+        return uid in self.prefs and self.prefs[uid][2] > 0
+
+    def fits(self, members):
+        if not all(self.available(uid) for uid in members):
+            return False
+        low = max(self.prefs[uid][0] for uid in members)
+        high = min(self.prefs[uid][1] for uid in members)
+        return low <= len(members) <= high
+
+    def accept(self, members):
+        if not self.fits(members):
+            return False
+        for uid in members:
+            self.prefs[uid][2] -= 1
+        return True
+
+
+class CliqueEngine(GroupingEngine):
+    def propose(self, g, seeds):
+        if seeds is None:
+            cliques = nx.find_cliques(g)
+        else:
+            cliques = cliques_around(g, seeds)
+        for clique in cliques:
+            if self.expired():
+                return
+            members = [uid for uid in clique if self.available(uid)]
+            if not members:
+                continue
+            size = min(self.prefs[uid][1] for uid in members)
+            low = max(self.prefs[uid][0] for uid in members)
+            for chunk in split_clique(sorted(members), size, low):
+                if self.accept(chunk):
+                    yield chunk
+
+
+class GreedyPackingEngine(GroupingEngine):
+    def prepare(self, g, user_ids):
+        users = CustomUser.objects.filter(
+            is_active=True,
+            interest_vector__isnull=False,
+        )
+        if user_ids is not None:
+            users = users.filter(id__in=user_ids)
+        self.vectors = dict(
+            users.values_list('id', 'interest_vector').iterator(),
+        )
+        self.weights = {}
+
+    def weights_of(self, g, uid):
+        if uid not in self.weights:
+            vec = self.vectors.get(uid)
+            neighbours = [n for n in g[uid] if n in self.vectors]
+            if vec is None or not neighbours:
+                self.weights[uid] = {}
+            else:
+                scores = similarity_batch(
+                    vec,
+                    as_matrix(
+                        [self.vectors[n] for n in neighbours],
+                        NUM_INTERESTS,
+                    ),
+                )
+                self.weights[uid] = dict(zip(neighbours, scores.tolist()))
+        return self.weights[uid]
+
+    def propose(self, g, seeds):
+        nodes = g if seeds is None else [uid for uid in seeds if uid in g]
+        order = sorted(nodes, key=lambda uid: (-g.degree(uid), uid))
+        for seed in order:
+            if self.expired():
+                return
+            if not self.available(seed):
+                continue
+            members = self.grow(g, seed)
+            if self.accept(members):
+                yield members
+
+    def grow(self, g, seed):
+        members = [seed]
+        high = self.prefs[seed][1]
+        score = dict(self.weights_of(g, seed))
+        candidates = {n for n in g[seed] if self.available(n)}
+        while candidates and len(members) < high:
+            eligible = [
+                n for n in candidates if self.prefs[n][1] > len(members)
+            ]
+            if not eligible:
+                break
+            best = max(eligible, key=lambda n: (score.get(n, 0.0), -n))
+            members.append(best)
+            high = min(high, self.prefs[best][1])
+            candidates &= set(g[best])
+            for n, weight in self.weights_of(g, best).items():
+                if n in candidates:
+                    score[n] = score.get(n, 0.0) + weight
+        return sorted(members)
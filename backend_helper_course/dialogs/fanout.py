@@ -0,0 +1,18 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+async def send_all(events, layer=None):
+    layer = layer or get_channel_layer()
+    await asyncio.gather(
+        *(layer.group_send(group, message) for group, message in events),
+    )
+
+
+def broadcast(events):
+    events = list(events)
+    if not events:
+        return
+    async_to_sync(send_all)(events)
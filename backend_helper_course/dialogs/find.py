@@ -1,14 +1,44 @@
 import logging
+import math
 
-from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.measure import D
+from django.db import connection, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Greatest, Sqrt
+from pgvector.django import L2Distance, MaxInnerProduct
 
 from users.models import CustomUser, Liked, Rejected
 
-from .utils import similarity
-
 logger = logging.getLogger(__name__)
 
 
+def _score_expression(vec_me, alpha):
+    # Та же оценка, что и dialogs.utils.similarity: центрированный косинус
+    # раскладывается через скалярные произведения (<#> в pgvector).
+    u = [float(x) for x in vec_me]
+    d = len(u)
+    sum_u = sum(u)
+    var_u = sum(x * x for x in u) - sum_u * sum_u / d
+    norm_u0 = math.sqrt(max(var_u, 0.0))
+    ones = [1.0] * d
+
+    dot = MaxInnerProduct('interest_vector', u) * -1.0
+    sum_v = MaxInnerProduct('interest_vector', ones) * -1.0
+    sq_v = MaxInnerProduct('interest_vector', F('interest_vector')) * -1.0
+    var_v = Greatest(
+        sq_v - sum_v * sum_v / Value(float(d)),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+    cos = (dot - sum_v * Value(sum_u / d)) / (
+        Sqrt(var_v) * Value(norm_u0) + Value(1e-8)
+    )
+    lvl = Value(1.0) - L2Distance('interest_vector', u) / Value(
+        math.sqrt(d) + 1e-8,
+    )
+    return Value(alpha) * cos + Value(1 - alpha) * lvl
+
+
 def find_candidates(
     user,
     limit=10,
@@ -19,39 +49,51 @@ def find_candidates(
     logger.debug('=== find_candidates for %s ===', user.id)
     me = user
     vec_me = me.interest_vector
+    if vec_me is None:
+        return []
+    vec_me = list(vec_me)
     rejected_ids = Rejected.objects.filter(user=me).values_list(
         'rejected_user_id',
         flat=True,
     )
-    logger.debug(rejected_ids)
     liked_ids = Liked.objects.filter(user=me).values_list(
         'liked_user_id',
         flat=True,
     )
-    logger.debug('rejected=%s  liked=%s', rejected_ids, liked_ids)
     qs = (
-        CustomUser.objects.filter(is_active=True, is_superuser=False)
+        CustomUser.objects.filter(
+            is_active=True,
+            is_superuser=False,
+            interest_vector__isnull=False,
+        )
         .exclude(id=me.id)
         .exclude(id__in=rejected_ids)
         .exclude(id__in=liked_ids)
     )
-    logger.debug('after basic filters: %s users', qs.count())
-    if me.location:
-        qs = (
-            qs.annotate(dist=Distance('location', me.location))
-            .filter(dist__lte=geo_radius_km * 1000)
-            .order_by('dist')
+    with transaction.atomic():
+        if me.location:
+            qs = qs.filter(
+                location__dwithin=(me.location, D(km=geo_radius_km)),
+            )
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET LOCAL hnsw.ef_search = %s',
+                    [max(pool_size, 40)],
+                )
+            shortlist = qs.order_by(
+                L2Distance('interest_vector', vec_me),
+            ).values('id')[:pool_size]
+            qs = CustomUser.objects.filter(id__in=shortlist)
+        candidates = list(
+            qs.annotate(score=_score_expression(vec_me, alpha)).order_by(
+                '-score',
+                'id',
+            )[:limit],
         )
-    candidates = list(qs[:pool_size])
-    logger.debug('pool sliced to %s users', len(candidates))
-    scored = [
-        (similarity(vec_me, c.interest_vector, alpha=alpha), c)
-        for c in candidates
-    ]
-    scored.sort(key=lambda x: x[0], reverse=True)
     logger.debug(
         'top score=%s  bottom score=%s',
-        scored[0][0] if scored else None,
-        scored[-1][0] if scored else None,
+        candidates[0].score if candidates else None,
+        candidates[-1].score if candidates else None,
     )
-    return [c for _, c in scored[:limit]]
+    return candidates
@@ -1,100 +1,285 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
 import networkx as nx
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.db import transaction
-from django.db.models import Count
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Coalesce, Lower, Trim
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
-from custom_groups.models import CustomGroup, GroupMember
-from dialogs.models import GroupChat, Notification
-from users.models import CustomUser
+from custom_groups.models import CustomGroup, GroupMember, members_signature
+from dialogs.fanout import broadcast
+from dialogs.models import Dialog, DialogMembership, GroupChat, Notification
+from users.models import CustomUser, MutualLike
 
-channel_layer = get_channel_layer()
+logger = logging.getLogger(__name__)
 MIN_SIZE = 5
 MAX_SIZE = 7
+LAST_RUN_KEY = 'grouping:last_run'
+RESCAN_OVERLAP = timedelta(minutes=1)
+EDGE_CHUNK_SIZE = 10_000
+GROUP_BATCH_SIZE = 500
 
 
-def build_graph():
-    g = nx.Graph()
+def cell_of(field='city_name'):
+    return Coalesce(Lower(Trim(field)), Value(''))
+
+
+def _active_edges(cell=None):
+    edges = MutualLike.objects.filter(
+        user__is_active=True,
+        partner__is_active=True,
+    )
+    if cell is not None:
+        edges = edges.alias(
+            user_cell=cell_of('user__city_name'),
+            partner_cell=cell_of('partner__city_name'),
+        ).filter(user_cell=cell, partner_cell=cell)
+    return edges.values_list('user_id', 'partner_id')
+
+
+def iter_mutual_edges(chunk_size=EDGE_CHUNK_SIZE, cell=None):
+    # Полная и инкрементальная пересборка читают рёбра из одной таблицы
+    # MutualLike; iterator() на Postgres идёт через серверный курсор.
+    return _active_edges(cell).iterator(chunk_size=chunk_size)
+
+
+def build_graph(cell=None):
     users = CustomUser.objects.filter(is_active=True)
-    for user in users:
-        g.add_node(user.id)
-    from users.models import Liked
-
-    for like in Liked.objects.select_related('user', 'liked_user'):
-        if Liked.objects.filter(
-            user=like.liked_user,
-            liked_user=like.user,
-        ).exists():
-            g.add_edge(like.user_id, like.liked_user_id)
+    if cell is not None:
+        users = users.alias(cell=cell_of()).filter(cell=cell)
+    g = nx.Graph()
+    g.add_nodes_from(users.values_list('id', flat=True).iterator())
+    g.add_edges_from(iter_mutual_edges(cell=cell))
     return g
 
 
-def split_clique(clique):
-    if len(clique) <= MAX_SIZE:
+def changed_users(since):
+    touched = set()
+    pairs = MutualLike.objects.filter(created_at__gte=since).values_list(
+        'user_id',
+        'partner_id',
+    )
+    for user_id, partner_id in pairs:
+        touched.update((user_id, partner_id))
+    return touched
+
+
+def build_local_graph(user_ids, cell=None):
+    around = set(user_ids)
+    for user_id, partner_id in _active_edges(cell).filter(
+        Q(user_id__in=user_ids) | Q(partner_id__in=user_ids),
+    ):
+        around.update((user_id, partner_id))
+    g = nx.Graph()
+    g.add_edges_from(
+        _active_edges(cell)
+        .filter(user_id__in=around, partner_id__in=around)
+        .iterator(),
+    )
+    return g
+
+
+def cliques_around(g, user_ids):
+    seen = set()
+    for user_id in user_ids:
+        if user_id not in g:
+            continue
+        for clique in nx.find_cliques(g, [user_id]):
+            key = frozenset(clique)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield clique
+
+
+def split_clique(clique, max_size=MAX_SIZE, min_size=MIN_SIZE):
+    if len(clique) <= max_size:
         return [clique]
     chunks = []
-    for i in range(0, len(clique), MAX_SIZE):
-        chunk = clique[i : i + MAX_SIZE]
-        if len(chunk) >= MIN_SIZE:
+    for i in range(0, len(clique), max_size):
+        chunk = clique[i : i + max_size]
+        if len(chunk) >= min_size:
             chunks.append(chunk)
 
     return chunks
 
 
-def group_exists(user_ids):
-    sorted_ids = sorted(user_ids)
-    return (
-        CustomGroup.objects.annotate(
-            members_ids=ArrayAgg(
-                'members__user_id',
-                distinct=True,
-                ordering='members__user_id',
-            ),
-            members_cnt=Count('members'),
-        )
-        .filter(members_cnt=len(sorted_ids), members_ids=sorted_ids)
-        .exists()
+def group_name(user_ids, names):
+    return 'Группа ' + ', '.join(names[uid] for uid in user_ids[:3]) + '…'
+
+
+def plan_cells(full=False):
+    since = None if full else cache.get(LAST_RUN_KEY)
+    users = CustomUser.objects.filter(is_active=True).annotate(
+        cell=cell_of(),
     )
+    if since is None:
+        cells = users.values_list('cell', flat=True).distinct()
+        return {cell: None for cell in cells}
+    touched = changed_users(since - RESCAN_OVERLAP)
+    cells = defaultdict(list)
+    for uid, cell in users.filter(id__in=touched).values_list('id', 'cell'):
+        cells[cell].append(uid)
+    return dict(cells)
 
 
-@transaction.atomic
-def build_groups():
-    g = build_graph()
-    for clique in nx.find_cliques(g):
-        if len(clique) < MIN_SIZE:
-            continue
-        for chunk in split_clique(clique):
-            if group_exists(chunk):
-                continue
-            create_group(chunk)
+def build_cell_groups(cell, seeds=None):
+    engine = import_string(settings.GROUPING_ENGINE)()
+    if seeds is None:
+        chunks = engine.run(build_graph(cell))
+    else:
+        g = build_local_graph(seeds, cell)
+        chunks = engine.run(g, seeds=set(seeds))
+    return len(materialize_groups(chunks))
 
 
-def create_group(user_ids):
-    users = CustomUser.objects.filter(id__in=user_ids)
-    name = ', '.join(u.first_name or u.username for u in users[:3]) + '…'
-    group = CustomGroup.objects.create(
-        name=f'Группа {name}',
-        description='Сформирована автоматически по интересам',
+def mark_run(started):
+    cache.set(LAST_RUN_KEY, started, None)
+
+
+def build_groups(full=False):
+    started = timezone.now()
+    created = sum(
+        build_cell_groups(cell, seeds)
+        for cell, seeds in plan_cells(full).items()
+    )
+    mark_run(started)
+    return created
+
+
+def materialize_groups(chunks, batch_size=GROUP_BATCH_SIZE):
+    pending = {}
+    for chunk in chunks:
+        user_ids = sorted(set(chunk))
+        pending.setdefault(members_signature(user_ids), user_ids)
+    existing = set(
+        CustomGroup.objects.filter(
+            member_signature__in=list(pending),
+        ).values_list('member_signature', flat=True),
+    )
+    pending = [
+        (signature, user_ids)
+        for signature, user_ids in pending.items()
+        if signature not in existing
+    ]
+    if not pending:
+        return []
+
+    all_ids = {uid for _, user_ids in pending for uid in user_ids}
+    names = {
+        uid: first_name or username
+        for uid, first_name, username in CustomUser.objects.filter(
+            id__in=all_ids,
+        ).values_list('id', 'first_name', 'username')
+    }
+    base_names = {
+        signature: group_name(user_ids, names)
+        for signature, user_ids in pending
+    }
+    taken = set(
+        CustomGroup.objects.filter(
+            name__in=set(base_names.values()),
+        ).values_list('name', flat=True),
+    )
+    planned = []
+    for signature, user_ids in pending:
+        name = base_names[signature]
+        if name in taken:
+            name = f'{name} #{signature[:8]}'
+        taken.add(name)
+        planned.append((signature, user_ids, name))
+
+    groups = []
+    for i in range(0, len(planned), batch_size):
+        batch = planned[i : i + batch_size]
+        try:
+            groups += _create_batch(batch)
+        except IntegrityError as exc:
+            logger.warning(
+                'skipped grouping batch of %d groups: %s',
+                len(batch),
+                exc,
+            )
+    return groups
+
+
+@transaction.atomic
+def _create_batch(planned):
+    groups = CustomGroup.objects.bulk_create(
+        [
+            CustomGroup(
+                name=name,
+                description='Сформирована автоматически по интересам',
+                member_signature=signature,
+            )
+            for signature, _, name in planned
+        ],
     )
     GroupMember.objects.bulk_create(
-        [GroupMember(user=u, group=group) for u in users],
+        [
+            GroupMember(user_id=uid, group=group)
+            for group, (_, user_ids, _) in zip(groups, planned)
+            for uid in user_ids
+        ],
     )
-    chat = GroupChat.objects.create(group=group)
-    chat.list_users.set(user_ids)
-    for uid in user_ids:
-        Notification.objects.create(
-            user_id=uid,
-            dialog=chat,
-            text=f'Вы добавлены в новую группу «{group.name}»',
-        )
-        async_to_sync(channel_layer.group_send)(
-            f'user_{uid}',
-            {
-                'type': 'notify',
-                'payload': {
-                    'dialog': chat.id,
-                    'text': f'Вы добавлены в новую группу «{group.name}»',
-                },
-            },
+    dialogs = Dialog.objects.bulk_create([Dialog() for _ in groups])
+    _insert_group_chats(
+        (dialog.id, group.id) for dialog, group in zip(dialogs, groups)
+    )
+    DialogMembership.objects.bulk_create(
+        [
+            DialogMembership(dialog_id=dialog.id, user_id=uid)
+            for dialog, (_, user_ids, _) in zip(dialogs, planned)
+            for uid in user_ids
+        ],
+    )
+
+    notifications = []
+    events = []
+    for group, dialog, (_, user_ids, _) in zip(groups, dialogs, planned):
+        text = f'Вы добавлены в новую группу «{group.name}»'
+        for uid in user_ids:
+            notifications.append(
+                Notification(
+                    user_id=uid,
+                    dialog_id=dialog.id,
+                    kind=Notification.GROUP,
+                    text=text,
+                ),
+            )
+            events.append(
+                (
+                    f'user_{uid}',
+                    {
+                        'type': 'notify',
+                        'payload': {'dialog': dialog.id, 'text': text},
+                    },
+                ),
+            )
+    Notification.objects.bulk_create(notifications)
+    transaction.on_commit(partial(broadcast, events), robust=True)
+    return groups
+
+
+def _insert_group_chats(rows):
+    rows = list(rows)
+    table = GroupChat._meta.db_table
+    ptr = GroupChat._meta.get_field('dialog_ptr').column
+    group = GroupChat._meta.get_field('group').column
+    values = ', '.join(['(%s, %s)'] * len(rows))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({ptr}, {group}) VALUES {values}',
+            [value for row in rows for value in row],
         )
+
+
+def create_group(user_ids):
+    groups = materialize_groups([user_ids])
+    return groups[0] if groups else None
@@ -0,0 +1,76 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Message
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+def encode_cursor(moment, pk):
+    raw = f'{moment.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(value):
+    if not isinstance(value, str):
+        raise InvalidPage(value)
+    try:
+        raw = base64.urlsafe_b64decode(value.encode()).decode()
+        created_at, pk = raw.split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeError) as exc:
+        raise InvalidPage(value) from exc
+
+
+def parse_limit(value):
+    if value in (None, ''):
+        return PAGE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError) as exc:
+        raise InvalidPage(value) from exc
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def message_page(dialog_id, before=None, after=None, limit=PAGE_SIZE):
+    qs = Message.objects.filter(dialog_id=dialog_id).select_related('sender')
+    if after is not None:
+        created_at, pk = decode_cursor(after)
+        qs = qs.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk),
+        ).order_by('created_at', 'id')
+        rows = list(qs[: limit + 1])
+        has_newer = len(rows) > limit
+        return rows[:limit], True, has_newer
+    if before is not None:
+        created_at, pk = decode_cursor(before)
+        qs = qs.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+        )
+    rows = list(qs.order_by('-created_at', '-id')[: limit + 1])
+    has_older = len(rows) > limit
+    return rows[:limit][::-1], has_older, before is not None
+
+
+def message_payload(msg):
+    sender = msg.sender
+    return {
+        'id': msg.id,
+        'sender': sender.id,
+        'sender_id': sender.id,
+        'sender_name': sender.username,
+        'sender_first_name': sender.first_name or '',
+        'sender_last_name': sender.last_name or '',
+        'sender_avatar': (
+            sender.profile_photo.url if sender.profile_photo else None
+        ),
+        'text': msg.text,
+        'created_at': msg.created_at.isoformat(),
+    }
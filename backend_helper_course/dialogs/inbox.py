@@ -0,0 +1,61 @@
+from django.db.models import (
+    F,
+    FilteredRelation,
+    OuterRef,
+    Prefetch,
+    Q,
+    Subquery,
+)
+
+from users.models import CustomUser
+
+from .history import PAGE_SIZE, decode_cursor
+from .models import Dialog, Message
+
+
+def inbox_queryset(user):
+    last = Message.objects.filter(dialog=OuterRef('pk')).order_by(
+        '-created_at',
+        '-id',
+    )
+    return (
+        Dialog.objects.alias(
+            mine=FilteredRelation(
+                'memberships',
+                condition=Q(memberships__user=user),
+            ),
+        )
+        .filter(mine__isnull=False)
+        .select_related('groupchat__group')
+        .prefetch_related(
+            Prefetch(
+                'list_users',
+                queryset=CustomUser.objects.exclude(id=user.id),
+                to_attr='others',
+            ),
+        )
+        .annotate(
+            last_message_id=Subquery(last.values('id')[:1]),
+            last_activity_at=F('mine__last_activity_at'),
+            unread_count=F('mine__unread_count'),
+        )
+    )
+
+
+def inbox_page(user, before=None, limit=PAGE_SIZE):
+    qs = inbox_queryset(user)
+    if before is not None:
+        moment, pk = decode_cursor(before)
+        qs = qs.filter(
+            Q(last_activity_at__lt=moment)
+            | Q(last_activity_at=moment, id__lt=pk),
+        )
+    dialogs = list(qs.order_by('-last_activity_at', '-id')[: limit + 1])
+    has_more = len(dialogs) > limit
+    dialogs = dialogs[:limit]
+    messages = Message.objects.in_bulk(
+        [d.last_message_id for d in dialogs if d.last_message_id],
+    )
+    for dialog in dialogs:
+        dialog.last_message = messages.get(dialog.last_message_id)
+    return dialogs, has_more
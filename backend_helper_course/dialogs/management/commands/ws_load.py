@@ -0,0 +1,370 @@
+import asyncio
+import itertools
+import json
+import re
+import time
+from pathlib import Path
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels import DEFAULT_CHANNEL_LAYER
+from channels.layers import InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand, CommandError
+
+from custom_groups.models import CustomGroup
+from dialogs.grouping import materialize_groups
+from dialogs.models import Dialog, DialogMembership, GroupChat, Notification
+from dialogs.routing import websocket_urlpatterns
+from helper import metrics
+from users.models import CustomUser
+
+MARK = re.compile(r'#load:(\d+)')
+PERCENTILES = (50, 95, 99)
+COUNTERS = ('queries', 'redis_calls', 'channel_sends')
+MEMORY_CAPACITY = 10_000
+CONNECT_TIMEOUT = 10
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ms = np.array(samples) * 1000
+    stats = {f'p{p}': float(np.percentile(ms, p)) for p in PERCENTILES}
+    stats['max'] = float(ms.max())
+    return {k: round(v, 2) for k, v in stats.items()}
+
+
+class Client:
+    # channels.testing тянет за собой daphne, а ApplicationCommunicator из
+    # asgiref запускает приложение в пустом контексте, и рекордер метрик
+    # не увидел бы вызовов Redis. Протокол тот же, только без изоляции.
+    def __init__(self, application, path, user):
+        self.inbox = asyncio.Queue()
+        self.outbox = asyncio.Queue()
+        scope = {
+            'type': 'websocket',
+            'path': path,
+            'query_string': b'',
+            'headers': [],
+            'subprotocols': [],
+            'user': user,
+        }
+        self.future = asyncio.ensure_future(
+            application(scope, self.inbox.get, self.outbox.put),
+        )
+
+    async def connect(self):
+        await self.inbox.put({'type': 'websocket.connect'})
+        response = await asyncio.wait_for(self.outbox.get(), CONNECT_TIMEOUT)
+        return response['type'] == 'websocket.accept'
+
+    async def send_json(self, content):
+        await self.inbox.put(
+            {'type': 'websocket.receive', 'text': json.dumps(content)},
+        )
+
+    async def receive_json(self):
+        message = await self.outbox.get()
+        return json.loads(message.get('text') or '{}')
+
+    async def disconnect(self):
+        await self.inbox.put({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.wait_for(self.future, CONNECT_TIMEOUT)
+
+
+class ChatLoad:
+    def __init__(self, chats, messages, interval, timeout, notify):
+        self.chats = chats
+        self.messages = messages
+        self.interval = interval
+        self.timeout = timeout
+        self.notify = notify
+        self.app = URLRouter(websocket_urlpatterns)
+        self.seq = itertools.count()
+        self.sent = {}
+        self.chat_latency = []
+        self.notify_latency = []
+        self.expected = sum(messages * (len(users) - 1) for _, users in chats)
+
+    async def connect(self, path, user):
+        comm = Client(self.app, path, user)
+        if not await comm.connect():
+            raise CommandError(f'{path}: соединение отклонено')
+        return comm
+
+    def received(self, samples, text):
+        match = MARK.search(text or '')
+        if match:
+            samples.append(time.perf_counter() - self.sent[int(match[1])])
+
+    async def read_chat(self, comm, user_id):
+        while True:
+            data = await comm.receive_json()
+            if data.get('sender_id') in (None, user_id):
+                continue
+            self.received(self.chat_latency, data.get('text'))
+            if len(self.chat_latency) >= self.expected:
+                self.done.set()
+
+    async def read_notify(self, comm):
+        while True:
+            data = await comm.receive_json()
+            if data.get('type') != 'batch':
+                self.received(self.notify_latency, data.get('text'))
+
+    async def send(self, members):
+        for i in range(self.messages):
+            seq = next(self.seq)
+            self.sent[seq] = time.perf_counter()
+            await members[i % len(members)].send_json(
+                {'text': f'Нагрузочное сообщение #load:{seq}'},
+            )
+            await asyncio.sleep(self.interval)
+
+    async def run(self, recorder):
+        self.done = asyncio.Event()
+        comms, chat_comms, readers = [], [], []
+        for dialog_id, users in self.chats:
+            members = []
+            for user in users:
+                # NotifyConsumer подключаем первым: его replay проходит через
+                # общий поток БД раньше подключения к чату и не попадает
+                # в замер.
+                if self.notify:
+                    comm = await self.connect('/ws/notifications/', user)
+                    comms.append(comm)
+                    readers.append(asyncio.create_task(self.read_notify(comm)))
+                comm = await self.connect(f'/ws/dialogs/{dialog_id}/', user)
+                comms.append(comm)
+                members.append(comm)
+                readers.append(
+                    asyncio.create_task(self.read_chat(comm, user.id)),
+                )
+            chat_comms.append(members)
+
+        before = {name: getattr(recorder, name) for name in COUNTERS}
+        started = time.perf_counter()
+        await asyncio.gather(*(self.send(members) for members in chat_comms))
+        try:
+            await asyncio.wait_for(self.done.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+        spent = {
+            name: getattr(recorder, name) - before[name] for name in COUNTERS
+        }
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        await asyncio.gather(
+            *(comm.disconnect() for comm in comms),
+            return_exceptions=True,
+        )
+        sent = len(self.sent)
+        return {
+            'chats': len(self.chats),
+            'clients': sum(len(users) for _, users in self.chats),
+            'messages': sent,
+            'elapsed_s': round(elapsed, 3),
+            'msg_per_s': round(sent / elapsed, 1),
+            'deliveries': len(self.chat_latency),
+            'expected': self.expected,
+            'latency_ms': percentiles(self.chat_latency),
+            'notify_deliveries': len(self.notify_latency),
+            'notify_latency_ms': percentiles(self.notify_latency),
+            **{
+                f'{name}_per_msg': round(value / sent, 2)
+                for name, value in spent.items()
+            },
+        }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон ChatConsumer и NotifyConsumer: задержка '
+        'доставки и запросы к БД на сообщение.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='2,7',
+            help='Размеры чатов через запятую: 2 — личный диалог, '
+            'больше — групповой чат.',
+        )
+        parser.add_argument(
+            '--chats',
+            type=int,
+            default=20,
+            help='Сколько чатов каждого размера гонять одновременно.',
+        )
+        parser.add_argument('--messages', type=int, default=50)
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=5,
+            help='Сообщений в секунду на чат, 0 — без пауз.',
+        )
+        parser.add_argument(
+            '--layer',
+            choices=['memory', 'redis'],
+            default='memory',
+            help='in-memory channel layer или настроенный в CHANNEL_LAYERS.',
+        )
+        parser.add_argument(
+            '--no-notify',
+            action='store_true',
+            help='Не подключать клиентов к NotifyConsumer.',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=30,
+            help='Сколько секунд ждать доставки после отправки.',
+        )
+        parser.add_argument(
+            '--json',
+            metavar='PATH',
+            help='Сохранить результаты в JSON.',
+        )
+        parser.add_argument('--prefix', default='load_')
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Не удалять созданных пользователей и чаты.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(v) for v in options['sizes'].split(',') if v.strip()]
+        except ValueError:
+            raise CommandError('--sizes: числа через запятую') from None
+        if not sizes or min(sizes) < 2:
+            raise CommandError('--sizes: минимум 2 участника')
+        if options['chats'] < 1 or options['messages'] < 1:
+            raise CommandError('--chats и --messages: минимум 1')
+        self.options = options
+        metrics.instrument()
+        results = {}
+        for size in sizes:
+            previous = self.swap_layer()
+            try:
+                created = self.populate(size)
+                try:
+                    results[f'chat_{size}'] = self.measure(created)
+                finally:
+                    if not options['keep']:
+                        self.cleanup(created)
+            finally:
+                if options['layer'] == 'memory':
+                    channel_layers.set(DEFAULT_CHANNEL_LAYER, previous)
+            self.report(size, results[f'chat_{size}'])
+        if options['json']:
+            Path(options['json']).write_text(
+                json.dumps(
+                    {'layer': options['layer'], 'results': results},
+                    ensure_ascii=False,
+                    indent=2,
+                ),
+                encoding='utf-8',
+            )
+
+    def swap_layer(self):
+        if self.options['layer'] != 'memory':
+            return None
+        # Очереди in-memory слоя привязаны к event loop, а async_to_sync
+        # поднимает новый на каждый сценарий.
+        return channel_layers.set(
+            DEFAULT_CHANNEL_LAYER,
+            InMemoryChannelLayer(capacity=MEMORY_CAPACITY),
+        )
+
+    def populate(self, size):
+        count = self.options['chats']
+        prefix = f'{self.options["prefix"]}{int(time.time())}_{size}_'
+        users = CustomUser.objects.bulk_create(
+            [
+                CustomUser(
+                    username=f'{prefix}{i}',
+                    password='!',
+                    first_name=f'Load{i}',
+                )
+                for i in range(count * size)
+            ],
+        )
+        members = [users[i : i + size] for i in range(0, len(users), size)]
+        group_ids = []
+        if size == 2:
+            dialogs = Dialog.objects.bulk_create([Dialog() for _ in members])
+            DialogMembership.objects.bulk_create(
+                [
+                    DialogMembership(dialog=dialog, user=user)
+                    for dialog, chat in zip(dialogs, members)
+                    for user in chat
+                ],
+            )
+            dialog_ids = [dialog.id for dialog in dialogs]
+        else:
+            groups = materialize_groups(
+                [[user.id for user in chat] for chat in members],
+            )
+            group_ids = [group.id for group in groups]
+            chat_of = dict(
+                GroupChat.objects.filter(group_id__in=group_ids).values_list(
+                    'group_id',
+                    'id',
+                ),
+            )
+            dialog_ids = [chat_of[group_id] for group_id in group_ids]
+            Notification.objects.filter(user__in=users).update(read=True)
+        return {
+            'users': [user.id for user in users],
+            'dialogs': dialog_ids,
+            'groups': group_ids,
+            'chats': list(zip(dialog_ids, members)),
+        }
+
+    def measure(self, created):
+        rate = self.options['rate']
+        load = ChatLoad(
+            created['chats'],
+            self.options['messages'],
+            1 / rate if rate else 0,
+            self.options['timeout'],
+            not self.options['no_notify'],
+        )
+        # Синхронный код консьюмеров (database_sync_to_async) выполняется
+        # в этом потоке, поэтому рекордер видит все их запросы. В гистограммы
+        # Prometheus прогон не пишем: stop() только отключает рекордер.
+        recorder = metrics.start()
+        try:
+            return async_to_sync(load.run)(recorder)
+        finally:
+            metrics.stop(recorder)
+
+    def cleanup(self, created):
+        Dialog.objects.filter(id__in=created['dialogs']).delete()
+        CustomGroup.objects.filter(id__in=created['groups']).delete()
+        CustomUser.objects.filter(id__in=created['users']).delete()
+
+    def report(self, size, row):
+        latency = ' '.join(f'{k}={v}ms' for k, v in row['latency_ms'].items())
+        self.stdout.write(
+            f'{size} участн. x {row["chats"]} чатов: '
+            f'{row["messages"]} сообщений за {row["elapsed_s"]}s '
+            f'({row["msg_per_s"]} msg/s), '
+            f'доставлено {row["deliveries"]}/{row["expected"]} {latency}; '
+            f'уведомлений {row["notify_deliveries"]}; '
+            f'на сообщение SQL={row["queries_per_msg"]} '
+            f'Redis={row["redis_calls_per_msg"]} '
+            f'channel={row["channel_sends_per_msg"]}',
+        )
+        if row['deliveries'] < row['expected']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f'не доставлено за {self.options["timeout"]}s: '
+                    f'{row["expected"] - row["deliveries"]}',
+                ),
+            )
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.8 on 2026-10-17 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+UPDATE dialogs_message m
+SET dialog_id = t.dialog_id
+FROM (
+    SELECT message_id, min(dialog_id) AS dialog_id
+    FROM dialogs_dialog_messages
+    GROUP BY message_id
+) t
+WHERE t.message_id = m.id;
+"""
+
+RESTORE_SQL = """
+INSERT INTO dialogs_dialog_messages (dialog_id, message_id)
+SELECT dialog_id, id FROM dialogs_message WHERE dialog_id IS NOT NULL;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialogs', '0002_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='dialog',
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='+',
+                to='dialogs.dialog',
+            ),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, RESTORE_SQL),
+        migrations.RemoveField(
+            model_name='dialog',
+            name='messages',
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='dialog',
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='messages',
+                related_query_name='dialogs',
+                to='dialogs.dialog',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(
+                fields=['dialog', 'created_at', 'id'],
+                name='dialogs_msg_history_idx',
+            ),
+        ),
+    ]
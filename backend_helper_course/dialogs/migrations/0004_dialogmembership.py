@@ -0,0 +1,117 @@
+# Generated by Django 5.2.8 on 2026-10-17 14:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_SQL = """
+UPDATE dialogs_dialog_list_users m
+SET last_activity_at = coalesce(
+    (
+        SELECT max(msg.created_at)
+        FROM dialogs_message msg
+        WHERE msg.dialog_id = m.dialog_id
+    ),
+    d.created_at
+)
+FROM dialogs_dialog d
+WHERE d.id = m.dialog_id;
+UPDATE dialogs_dialog_list_users m
+SET unread_count = n.unread
+FROM (
+    SELECT user_id, dialog_id, count(*) AS unread
+    FROM dialogs_notification
+    WHERE NOT read
+    GROUP BY user_id, dialog_id
+) n
+WHERE n.user_id = m.customuser_id AND n.dialog_id = m.dialog_id;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialogs', '0003_message_dialog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='DialogMembership',
+                    fields=[
+                        (
+                            'id',
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name='ID',
+                            ),
+                        ),
+                        (
+                            'dialog',
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name='memberships',
+                                to='dialogs.dialog',
+                            ),
+                        ),
+                        (
+                            'user',
+                            models.ForeignKey(
+                                db_column='customuser_id',
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name='dialog_memberships',
+                                to=settings.AUTH_USER_MODEL,
+                            ),
+                        ),
+                    ],
+                    options={
+                        'db_table': 'dialogs_dialog_list_users',
+                        'unique_together': {('dialog', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='dialog',
+                    name='list_users',
+                    field=models.ManyToManyField(
+                        related_name='list_users',
+                        through='dialogs.DialogMembership',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dialogmembership',
+            name='last_read_message',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+',
+                to='dialogs.message',
+            ),
+        ),
+        migrations.AddField(
+            model_name='dialogmembership',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dialogmembership',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='dialogmembership',
+            index=models.Index(
+                fields=['user', 'last_activity_at', 'dialog'],
+                name='dialogs_inbox_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.8 on 2026-10-17 15:00
+
+from django.db import migrations, models
+
+CLASSIFY_SQL = """
+UPDATE dialogs_notification SET kind = 'match'
+WHERE text LIKE 'У вас новый матч%';
+UPDATE dialogs_notification SET kind = 'group'
+WHERE text LIKE 'Вы добавлены в новую группу%';
+"""
+
+COLLAPSE_SQL = """
+WITH ranked AS (
+    SELECT id,
+           row_number() OVER (
+               PARTITION BY user_id, dialog_id
+               ORDER BY created_at DESC, id DESC
+           ) AS rn,
+           count(*) OVER (PARTITION BY user_id, dialog_id) AS total
+    FROM dialogs_notification
+    WHERE NOT read AND kind = 'message'
+),
+kept AS (
+    UPDATE dialogs_notification n
+    SET count = r.total
+    FROM ranked r
+    WHERE r.id = n.id AND r.rn = 1
+)
+DELETE FROM dialogs_notification n
+USING ranked r
+WHERE r.id = n.id AND r.rn > 1;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialogs', '0004_dialogmembership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(
+                choices=[
+                    ('message', 'Сообщение'),
+                    ('match', 'Матч'),
+                    ('group', 'Группа'),
+                ],
+                default='message',
+                max_length=10,
+            ),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunSQL(CLASSIFY_SQL, migrations.RunSQL.noop),
+        migrations.RunSQL(COLLAPSE_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('kind', 'message'), ('read', False)),
+                fields=('user', 'dialog'),
+                name='notification_unread_message_uniq',
+            ),
+        ),
+    ]
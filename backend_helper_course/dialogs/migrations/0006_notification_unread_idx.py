@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-17 22:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dialogs', '0005_notification_kind_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(
+                condition=models.Q(('read', False)),
+                fields=['user', '-created_at', '-id'],
+                name='notification_unread_idx',
+            ),
+        ),
+    ]
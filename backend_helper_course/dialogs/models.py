@@ -11,19 +11,36 @@ class Message(models.Model):
         on_delete=models.CASCADE,
         related_name='messages',
     )
+    dialog = models.ForeignKey(
+        'Dialog',
+        on_delete=models.CASCADE,
+        null=True,
+        related_name='messages',
+        related_query_name='dialogs',
+        db_index=False,
+    )
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = 'Сообщение'
         verbose_name_plural = 'Сообщения'
+        indexes = [
+            models.Index(
+                fields=['dialog', 'created_at', 'id'],
+                name='dialogs_msg_history_idx',
+            ),
+        ]
 
 
 class Dialog(models.Model):
-    list_users = models.ManyToManyField(CustomUser, related_name='list_users')
+    list_users = models.ManyToManyField(
+        CustomUser,
+        related_name='list_users',
+        through='DialogMembership',
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    messages = models.ManyToManyField(Message, related_name='dialogs')
 
     class Meta:
         verbose_name = 'Диалог'
@@ -31,6 +48,64 @@ class Dialog(models.Model):
         ordering = ['-created_at']
 
 
+class DialogMembership(models.Model):
+    dialog = models.ForeignKey(
+        Dialog,
+        on_delete=models.CASCADE,
+        related_name='memberships',
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='dialog_memberships',
+        db_column='customuser_id',
+    )
+    last_read_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    unread_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'dialogs_dialog_list_users'
+        unique_together = ('dialog', 'user')
+        indexes = [
+            models.Index(
+                fields=['user', 'last_activity_at', 'dialog'],
+                name='dialogs_inbox_idx',
+            ),
+        ]
+
+    @classmethod
+    def record_message(cls, msg):
+        cls.objects.filter(dialog_id=msg.dialog_id).update(
+            last_activity_at=msg.created_at,
+            unread_count=models.Case(
+                models.When(user_id=msg.sender_id, then=models.Value(0)),
+                default=models.F('unread_count') + 1,
+            ),
+            last_read_message_id=models.Case(
+                models.When(user_id=msg.sender_id, then=models.Value(msg.id)),
+                default=models.F('last_read_message_id'),
+            ),
+        )
+
+    @classmethod
+    def mark_read(cls, dialog_id, user_id):
+        last = Message.objects.filter(dialog_id=dialog_id).order_by(
+            '-created_at',
+            '-id',
+        )
+        cls.objects.filter(dialog_id=dialog_id, user_id=user_id).update(
+            unread_count=0,
+            last_read_message_id=models.Subquery(last.values('id')[:1]),
+        )
+
+
 class GroupChat(Dialog):
     group = models.ForeignKey(
         CustomGroup,
@@ -45,15 +120,44 @@ class GroupChat(Dialog):
 
 
 class Notification(models.Model):
+    MESSAGE = 'message'
+    MATCH = 'match'
+    GROUP = 'group'
+    KIND_CHOICES = [
+        (MESSAGE, 'Сообщение'),
+        (MATCH, 'Матч'),
+        (GROUP, 'Группа'),
+    ]
+
     user = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,
         related_name='notifications',
     )
     dialog = models.ForeignKey(Dialog, on_delete=models.CASCADE)
+    kind = models.CharField(
+        max_length=10,
+        choices=KIND_CHOICES,
+        default=MESSAGE,
+    )
+    count = models.PositiveIntegerField(default=1)
     text = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
     read = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'dialog'],
+                condition=models.Q(read=False, kind='message'),
+                name='notification_unread_message_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                condition=models.Q(read=False),
+                name='notification_unread_idx',
+            ),
+        ]
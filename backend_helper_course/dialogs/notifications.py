@@ -0,0 +1,164 @@
+import logging
+
+import redis
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import DialogMembership, Notification
+
+logger = logging.getLogger(__name__)
+PUSH_WINDOW_MS = 3000
+PENDING_TTL_MS = 10 * PUSH_WINDOW_MS
+REPLAY_LIMIT = 100
+
+UPSERT_SQL = """
+INSERT INTO dialogs_notification
+    (user_id, dialog_id, kind, count, text, created_at, read)
+VALUES {values}
+ON CONFLICT (user_id, dialog_id) WHERE NOT read AND kind = 'message'
+DO UPDATE SET
+    count = dialogs_notification.count + 1,
+    text = EXCLUDED.text,
+    created_at = EXCLUDED.created_at
+RETURNING user_id, count
+"""
+
+
+# Окно пушей: первое сообщение пушится сразу, остальные в окне только
+# помечаются, и по его истечении уходит один пуш с итоговым count.
+CLAIM_PUSHES_LUA = """
+local result = {}
+for i = 1, #KEYS, 2 do
+    if redis.call('SET', KEYS[i], 1, 'NX', 'PX', ARGV[1]) then
+        result[#result + 1] = -1
+    elseif redis.call('SET', KEYS[i + 1], 1, 'NX', 'PX', ARGV[2]) then
+        result[#result + 1] = math.max(redis.call('PTTL', KEYS[i]), 1)
+    else
+        result[#result + 1] = 0
+    end
+end
+return result
+"""
+
+push_cli = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    password=settings.REDIS_PASSWORD,
+    db=6,
+)
+claim_script = push_cli.register_script(CLAIM_PUSHES_LUA)
+
+
+def push_key(user_id, dialog_id):
+    return f'notify:{user_id}:{dialog_id}'
+
+
+def pending_key(user_id, dialog_id):
+    return f'notify:pending:{user_id}:{dialog_id}'
+
+
+def add_message_notifications(dialog_id, user_ids, text):
+    if not user_ids:
+        return {}
+    now = timezone.now()
+    values = ', '.join(['(%s, %s, %s, 1, %s, %s, false)'] * len(user_ids))
+    params = []
+    for uid in user_ids:
+        params += [uid, dialog_id, Notification.MESSAGE, text, now]
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format(values=values), params)
+        return dict(cursor.fetchall())
+
+
+def claim_pushes(dialog_id, user_ids):
+    if not user_ids:
+        return []
+    keys = []
+    for uid in user_ids:
+        keys += [push_key(uid, dialog_id), pending_key(uid, dialog_id)]
+    states = claim_script(keys=keys, args=[PUSH_WINDOW_MS, PENDING_TTL_MS])
+    fresh = []
+    for uid, state in zip(user_ids, states):
+        if state < 0:
+            fresh.append(uid)
+        elif state > 0:
+            schedule_flush(uid, dialog_id, state / 1000)
+    return fresh
+
+
+def schedule_flush(user_id, dialog_id, countdown):
+    from dialogs.tasks import flush_push
+
+    # Вызывается на горячем пути сообщения: брокер не должен ни задерживать,
+    # ни ронять запись, поэтому без повторов публикации, ошибку только пишем
+    # в лог. Потерянный хвостовой пуш не страшен — уведомление уже в БД.
+    try:
+        flush_push.apply_async(
+            (user_id, dialog_id),
+            countdown=countdown,
+            retry=False,
+        )
+    except Exception:
+        logger.warning(
+            'flush_push not scheduled for user=%s dialog=%s',
+            user_id,
+            dialog_id,
+            exc_info=True,
+        )
+
+
+def trailing_push(user_id, dialog_id):
+    pipe = push_cli.pipeline()
+    pipe.get(pending_key(user_id, dialog_id))
+    pipe.delete(pending_key(user_id, dialog_id))
+    pending, _ = pipe.execute()
+    if not pending:
+        return None
+    return (
+        Notification.objects.filter(
+            user_id=user_id,
+            dialog_id=dialog_id,
+            kind=Notification.MESSAGE,
+            read=False,
+        )
+        .values('text', 'count')
+        .first()
+    )
+
+
+def unread_batch(user_id, limit=REPLAY_LIMIT):
+    notes = list(
+        Notification.objects.filter(user_id=user_id, read=False).order_by(
+            '-created_at',
+            '-id',
+        )[: limit + 1],
+    )
+    more = len(notes) > limit
+    notes = notes[:limit]
+    partners = dict(
+        DialogMembership.objects.filter(
+            dialog_id__in={n.dialog_id for n in notes},
+        )
+        .exclude(user_id=user_id)
+        .order_by('dialog_id', 'user_id')
+        .distinct('dialog_id')
+        .values_list('dialog_id', 'user_id'),
+    )
+    items = [
+        {
+            'dialog': str(n.dialog_id),
+            'text': n.text,
+            'kind': n.kind,
+            'count': n.count,
+            'from': partners.get(n.dialog_id),
+            'id': n.id,
+            'created_at': n.created_at.isoformat(),
+        }
+        for n in notes
+    ]
+    return items, more
+
+
+def mark_read(ids):
+    return Notification.objects.filter(pk__in=ids).update(read=True)
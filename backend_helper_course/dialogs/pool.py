@@ -0,0 +1,88 @@
+import redis
+from django.conf import settings
+
+from users.models import CustomUser, Liked, Rejected
+
+POOL_SIZE = 100
+POOL_TTL = 24 * 3600
+POOL_LOW_WATERMARK = 20
+REFRESH_LOCK_TTL = 60
+
+redis_cli = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    password=settings.REDIS_PASSWORD,
+    db=5,
+)
+
+
+def pool_key(user_id):
+    return f'cand:pool:{user_id}'
+
+
+def store_pool(user_id, candidates):
+    key = pool_key(user_id)
+    pipe = redis_cli.pipeline()
+    pipe.delete(key)
+    if candidates:
+        pipe.zadd(key, {c.id: round(float(c.score), 4) for c in candidates})
+        pipe.expire(key, POOL_TTL)
+    pipe.execute()
+
+
+def load_pool(user_id):
+    return [
+        [int(uid), score]
+        for uid, score in redis_cli.zrevrange(
+            pool_key(user_id),
+            0,
+            -1,
+            withscores=True,
+        )
+    ]
+
+
+def claim_refresh(user_id):
+    return bool(
+        redis_cli.set(
+            f'cand:refresh:{user_id}',
+            1,
+            nx=True,
+            ex=REFRESH_LOCK_TTL,
+        ),
+    )
+
+
+def take_from_pool(user, limit=10):
+    entries = load_pool(user.id)
+    if not entries:
+        return [], 0
+    ids = [uid for uid, _ in entries]
+    seen = set(
+        Liked.objects.filter(user=user, liked_user_id__in=ids)
+        .values_list('liked_user_id', flat=True)
+        .union(
+            Rejected.objects.filter(
+                user=user,
+                rejected_user_id__in=ids,
+            ).values_list('rejected_user_id', flat=True),
+        ),
+    )
+    fresh = [e for e in entries if e[0] not in seen]
+    head = fresh[:limit]
+    users = CustomUser.objects.filter(
+        id__in=[uid for uid, _ in head],
+        is_active=True,
+    ).in_bulk()
+    # Отданные и уже просмотренные удаляем поштучно: ZREM не затирает пул,
+    # который параллельно успел записать refresh_candidate_cache.
+    redis_cli.zrem(pool_key(user.id), *seen, *(uid for uid, _ in head))
+
+    result = []
+    for uid, score in head:
+        candidate = users.get(uid)
+        if candidate is None:
+            continue
+        candidate.score = score
+        result.append(candidate)
+    return result, len(fresh) - len(head)
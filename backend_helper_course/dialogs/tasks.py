@@ -1,18 +1,13 @@
-import json
+from datetime import datetime
 
-import redis
-from celery import shared_task
-from django.conf import settings
+from celery import chord, shared_task
+from django.utils import timezone
 
+from dialogs.fanout import broadcast
 from dialogs.find import find_candidates
-from dialogs.grouping import build_groups
-
-redis_cli = redis.Redis(
-    host=settings.REDIS_HOST,
-    port=settings.REDIS_PORT,
-    password=settings.REDIS_PASSWORD,
-    db=5,
-)
+from dialogs.grouping import build_cell_groups, mark_run, plan_cells
+from dialogs.notifications import trailing_push
+from dialogs.pool import POOL_SIZE, store_pool
 
 
 @shared_task
@@ -20,8 +15,7 @@ def refresh_candidate_cache(user_id):
     from users.models import CustomUser
 
     user = CustomUser.objects.get(pk=user_id)
-    pool = find_candidates(user, limit=100)
-    redis_cli.set(f'cand:{user_id}', json.dumps(pool), ex=24 * 3600)
+    store_pool(user_id, find_candidates(user, limit=POOL_SIZE))
 
 
 @shared_task
@@ -33,5 +27,37 @@ def refresh_all_caches():
 
 
 @shared_task
-def refresh_groups():
-    build_groups()
+def refresh_groups(full=False):
+    started = timezone.now().isoformat()
+    cells = plan_cells(full=full)
+    if not cells:
+        mark_run(datetime.fromisoformat(started))
+        return
+    header = [
+        refresh_cell_groups.s(cell, seeds) for cell, seeds in cells.items()
+    ]
+    chord(header)(finish_groups.s(started))
+
+
+@shared_task
+def refresh_cell_groups(cell, seeds=None):
+    return build_cell_groups(cell, seeds)
+
+
+@shared_task
+def finish_groups(created, started):
+    mark_run(datetime.fromisoformat(started))
+    return sum(created)
+
+
+@shared_task
+def flush_push(user_id, dialog_id):
+    note = trailing_push(user_id, dialog_id)
+    if note is None:
+        return
+    payload = {
+        'dialog': dialog_id,
+        'text': note['text'],
+        'count': note['count'],
+    }
+    broadcast([(f'user_{user_id}', {'type': 'notify', 'payload': payload})])
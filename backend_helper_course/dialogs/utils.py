@@ -6,15 +6,31 @@ def centered(v):
     return arr - arr.mean()
 
 
-def similarity(u, v, alpha=0.5):
-    u_clean = [1 if x is None else x for x in u]
-    v_clean = [1 if x is None else x for x in v]
-    u_arr = np.array(u_clean, dtype=float)
-    v_arr = np.array(v_clean, dtype=float)
+def as_matrix(vectors, dims, missing=1.0):
+    mat = np.zeros((len(vectors), dims), dtype=float)
+    for i, vec in enumerate(vectors):
+        if vec is None:
+            continue
+        mat[i] = [missing if x is None else x for x in vec]
+    return mat
+
+
+def similarity_batch(u, matrix, alpha=0.5):
+    u_arr = as_matrix([u], len(u))[0]
+    mat = np.asarray(matrix, dtype=float).reshape(-1, len(u_arr))
+    if not len(mat):
+        return np.zeros(0, dtype=float)
     u0 = u_arr - u_arr.mean()
-    v0 = v_arr - v_arr.mean()
-    cos = np.dot(u0, v0) / (np.linalg.norm(u0) * np.linalg.norm(v0) + 1e-8)
-    eu = np.linalg.norm(u_arr - v_arr)
-    maxd = np.linalg.norm(np.array([1.0] * len(u_arr)))
+    u0_norm = np.linalg.norm(u0)
+    m0 = mat - mat.mean(axis=1, keepdims=True)
+    cos = (m0 @ u0) / (np.linalg.norm(m0, axis=1) * u0_norm + 1e-8)
+    eu = np.linalg.norm(mat - u_arr, axis=1)
+    maxd = np.sqrt(len(u_arr))
     lvl = 1.0 - eu / (maxd + 1e-8)
     return alpha * cos + (1 - alpha) * lvl
+
+
+def similarity(u, v, alpha=0.5):
+    return float(
+        similarity_batch(u, as_matrix([v], len(v)), alpha=alpha)[0],
+    )
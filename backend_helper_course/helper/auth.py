@@ -1,27 +1,106 @@
+import hashlib
+import threading
+import time
+
 import jwt
+from cachetools import TLRUCache, TTLCache
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from jwt import (
-    ExpiredSignatureError,
-    InvalidAudienceError,
-    InvalidSignatureError,
-    InvalidTokenError,
-    PyJWKClient,
-)
+from jwt import ExpiredSignatureError, InvalidAudienceError, InvalidTokenError
 from rest_framework import authentication, exceptions
 
+from .jwks import JWKSKeyManager
+
 User = get_user_model()
-_jwks_client = PyJWKClient(settings.KEYCLOAK_JWKS_URL)
+_jwks = JWKSKeyManager(
+    settings.KEYCLOAK_JWKS_URL,
+    refresh_interval=settings.JWKS_REFRESH_INTERVAL,
+    min_interval=settings.JWKS_MIN_REFRESH_INTERVAL,
+)
 
 SPA_CLIENT = 'spa'
 ALLOWED_ALG = ['RS256']
 
+CLAIMS_CACHE_SIZE = 10_000
+USER_CACHE_SIZE = 10_000
+USER_CACHE_TTL = 300
+
+_cache_lock = threading.Lock()
+_claims_cache = TLRUCache(
+    maxsize=CLAIMS_CACHE_SIZE,
+    ttu=lambda _key, claims, now: claims.get('exp', now),
+    timer=time.time,
+)
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def cached_claims(token):
+    with _cache_lock:
+        return _claims_cache.get(token_key(token))
+
+
+def claims_username(payload):
+    return (
+        payload.get('preferred_username')
+        or payload.get('email')
+        or payload['sub']
+    )
+
+
+def claims_fields(payload):
+    return {
+        'email': payload.get('email', ''),
+        'first_name': payload.get('given_name')
+        or payload.get('first_name', ''),
+        'last_name': payload.get('family_name')
+        or payload.get('last_name', ''),
+        'is_active': True,
+    }
+
+
+def sync_user(username, fields):
+    user, created = User.objects.get_or_create(
+        username=username,
+        defaults=fields,
+    )
+    if not created:
+        changed = [
+            name
+            for name, value in fields.items()
+            if getattr(user, name) != value
+        ]
+        if changed:
+            for name in changed:
+                setattr(user, name, fields[name])
+            user.save(update_fields=changed)
+    return user
+
+
+def resolve_user(payload):
+    username = claims_username(payload)
+    fields = claims_fields(payload)
+    digest = tuple(fields.values())
+    with _cache_lock:
+        cached = _user_cache.get(username)
+    user = None
+    if cached is not None and cached[1] == digest:
+        user = User.objects.filter(pk=cached[0], is_active=True).first()
+    if user is None:
+        user = sync_user(username, fields)
+        with _cache_lock:
+            _user_cache[username] = (user.pk, digest)
+    return user
+
 
 class KeycloakJWTAuthentication(authentication.BaseAuthentication):
     keyword = 'Bearer'
 
     def _decode(self, token: str) -> dict:
-        signing_key = _jwks_client.get_signing_key_from_jwt(token).key
+        signing_key = _jwks.get_signing_key(token).key
         return jwt.decode(
             token,
             signing_key,
@@ -40,6 +119,15 @@ class KeycloakJWTAuthentication(authentication.BaseAuthentication):
         if SPA_CLIENT not in aud and payload.get('azp') != SPA_CLIENT:
             raise InvalidAudienceError('Audience mismatch')
 
+    def verify(self, token: str) -> dict:
+        payload = cached_claims(token)
+        if payload is None:
+            payload = self._decode(token)
+            self._check_audience(payload)
+            with _cache_lock:
+                _claims_cache[token_key(token)] = payload
+        return payload
+
     def authenticate(self, request):
         header = authentication.get_authorization_header(request).decode()
         if not header.lower().startswith(f'{self.keyword.lower()} '):
@@ -48,33 +136,11 @@ class KeycloakJWTAuthentication(authentication.BaseAuthentication):
         token = header.split()[1]
 
         try:
-            try:
-                payload = self._decode(token)
-            except InvalidSignatureError:
-                _jwks_client.fetch_data()
-                payload = self._decode(token)
-
-            self._check_audience(payload)
+            payload = self.verify(token)
         except ExpiredSignatureError:
             raise exceptions.AuthenticationFailed('JWT expired')
         except InvalidAudienceError:
             raise exceptions.AuthenticationFailed('JWT audience mismatch')
         except InvalidTokenError:
             raise exceptions.AuthenticationFailed('JWT error: Invalid Token')
-        username = (
-            payload.get('preferred_username')
-            or payload.get('email')
-            or payload['sub']
-        )
-        user, _ = User.objects.update_or_create(
-            username=username,
-            defaults={
-                'email': payload.get('email', ''),
-                'first_name': payload.get('given_name')
-                or payload.get('first_name', ''),
-                'last_name': payload.get('family_name')
-                or payload.get('last_name', ''),
-                'is_active': True,
-            },
-        )
-        return (user, payload)
+        return (resolve_user(payload), payload)
@@ -2,6 +2,8 @@ import os
 
 from celery import Celery
 
+from . import metrics  # noqa: F401
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'helper.settings')
 
 app = Celery('helper')
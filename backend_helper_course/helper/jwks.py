@@ -0,0 +1,108 @@
+import json
+import logging
+import threading
+import time
+import urllib.request
+
+import jwt
+from django.core.cache import cache
+from jwt import InvalidTokenError, PyJWKSet, PyJWTError
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'jwks:keys'
+
+
+class JWKSKeyManager:
+    def __init__(
+        self,
+        url,
+        refresh_interval=300,
+        min_interval=10,
+        timeout=5,
+        cache_key=CACHE_KEY,
+    ):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.cache_key = cache_key
+        self.keys = {}
+        self.version = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._attempted_at = float('-inf')
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop,
+                    name='jwks-refresh',
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('JWKS background refresh failed')
+
+    def fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as resp:
+            return json.load(resp)
+
+    def install(self, shared):
+        if shared['version'] <= self.version:
+            return
+        keys = PyJWKSet.from_dict(shared['jwks']).keys
+        self.keys = {
+            key.key_id: key
+            for key in keys
+            if key.key_id and key.public_key_use in ('sig', None)
+        }
+        self.version = shared['version']
+
+    def load_shared(self):
+        shared = cache.get(self.cache_key)
+        if shared:
+            self.install(shared)
+
+    def refresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._attempted_at < self.min_interval:
+                return False
+            self._attempted_at = now
+            throttle_key = f'{self.cache_key}:throttle'
+            if not cache.add(throttle_key, 1, self.min_interval):
+                self.load_shared()
+                return False
+            try:
+                shared = {'version': time.time(), 'jwks': self.fetch()}
+                self.install(shared)
+            except (OSError, ValueError, PyJWTError):
+                logger.warning('JWKS fetch from %s failed', self.url)
+                return False
+            cache.set(self.cache_key, shared, None)
+            return True
+
+    def get_signing_key(self, token):
+        self.start()
+        kid = jwt.get_unverified_header(token).get('kid')
+        if kid not in self.keys:
+            self.load_shared()
+        if kid not in self.keys:
+            self.refresh()
+        try:
+            return self.keys[kid]
+        except KeyError:
+            raise InvalidTokenError(f'Unknown signing key {kid!r}') from None
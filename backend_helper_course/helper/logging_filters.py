@@ -81,3 +81,13 @@ class MaskSecretsFilter(logging.Filter):
             record.extra = self._mask_obj(record.extra)  # pragma: no cover
 
         return True
+
+
+class LazyMaskedBody:
+    masker = MaskSecretsFilter()
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+
+    def __str__(self):
+        return self.masker._mask_str(self.raw.decode(errors='replace'))
@@ -0,0 +1,196 @@
+import contextvars
+import functools
+import inspect
+import os
+import time
+
+from celery.signals import task_postrun, task_prerun, worker_init
+from django.conf import settings
+from django.db import connection
+from django.http import (
+    HttpResponse,
+    HttpResponseForbidden,
+    HttpResponseNotFound,
+)
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LABELS = ['kind', 'name']
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+DURATION = Histogram(
+    'hobbymate_duration_seconds',
+    'Wall time of a view or Celery task',
+    LABELS,
+)
+DB_QUERIES = Histogram(
+    'hobbymate_db_queries',
+    'SQL queries per view or Celery task',
+    LABELS,
+    buckets=COUNT_BUCKETS,
+)
+DB_SECONDS = Histogram(
+    'hobbymate_db_seconds',
+    'Time spent in SQL per view or Celery task',
+    LABELS,
+)
+REDIS_CALLS = Histogram(
+    'hobbymate_redis_calls',
+    'Redis round trips per view or Celery task',
+    LABELS,
+    buckets=COUNT_BUCKETS,
+)
+CHANNEL_SENDS = Histogram(
+    'hobbymate_channel_sends',
+    'Channel layer sends per view or Celery task',
+    LABELS,
+    buckets=COUNT_BUCKETS,
+)
+
+_current = contextvars.ContextVar('metrics_recorder', default=None)
+_running = {}
+_instrumented = False
+
+
+class Recorder:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.redis_calls = 0
+        self.channel_sends = 0
+        self.started = time.perf_counter()
+        self.token = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - started
+
+
+def start():
+    recorder = Recorder()
+    recorder.token = _current.set(recorder)
+    connection.execute_wrappers.append(recorder)
+    return recorder
+
+
+def stop(recorder):
+    _current.reset(recorder.token)
+    if recorder in connection.execute_wrappers:
+        connection.execute_wrappers.remove(recorder)
+
+
+def finish(recorder, kind, name):
+    stop(recorder)
+    labels = {'kind': kind, 'name': name}
+    DURATION.labels(**labels).observe(time.perf_counter() - recorder.started)
+    DB_QUERIES.labels(**labels).observe(recorder.queries)
+    DB_SECONDS.labels(**labels).observe(recorder.db_seconds)
+    REDIS_CALLS.labels(**labels).observe(recorder.redis_calls)
+    CHANNEL_SENDS.labels(**labels).observe(recorder.channel_sends)
+
+
+def _count(field):
+    recorder = _current.get()
+    if recorder is not None:
+        setattr(recorder, field, getattr(recorder, field) + 1)
+
+
+def _counted(func, field):
+    if inspect.iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            _count(field)
+            return await func(*args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _count(field)
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def instrument():
+    global _instrumented
+    if _instrumented:
+        return
+    _instrumented = True
+
+    from channels_redis.core import RedisChannelLayer
+    from redis import Redis
+    from redis.client import Pipeline
+
+    patches = [
+        (Redis, 'execute_command', 'redis_calls'),
+        (Pipeline, 'execute', 'redis_calls'),
+        (RedisChannelLayer, 'send', 'channel_sends'),
+        (RedisChannelLayer, 'group_send', 'channel_sends'),
+    ]
+    for cls, attr, field in patches:
+        setattr(cls, attr, _counted(getattr(cls, attr), field))
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument()
+
+    def __call__(self, request):
+        recorder = start()
+        try:
+            return self.get_response(request)
+        finally:
+            match = request.resolver_match
+            name = match.view_name if match else 'unmatched'
+            finish(recorder, 'view', name)
+
+
+@worker_init.connect
+def on_worker_init(**kwargs):
+    instrument()
+
+
+@task_prerun.connect
+def on_task_prerun(task_id=None, **kwargs):
+    _running[task_id] = start()
+
+
+@task_postrun.connect
+def on_task_postrun(task_id=None, task=None, **kwargs):
+    recorder = _running.pop(task_id, None)
+    if recorder is not None:
+        finish(recorder, 'task', task.name)
+
+
+def registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return REGISTRY
+    collector = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector)
+    return collector
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # Без токена эндпоинт закрыт: метрики не должны торчать наружу.
+    if not token:
+        return HttpResponseNotFound()
+    if request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(registry()),
+        content_type=CONTENT_TYPE_LATEST,
+    )
@@ -1,32 +1,101 @@
 import logging
+import random
+import time
+
+from django.conf import settings
+
+from .logging_filters import LazyMaskedBody
 
 __all__ = []
 
+ACCESS_LOG_DEFAULTS = {
+    'LOGGER': 'drf.request',
+    'SAMPLE_RATE': 0.1,
+    'ROUTES': {},
+    'LOG_BODIES': False,
+    'MAX_BODY_BYTES': 2_000,
+    'SKIP_BODY_CONTENT_TYPES': [
+        'multipart/form-data',
+        'application/octet-stream',
+    ],
+    'ALWAYS_LOG_STATUS': 500,
+}
+
 
-class DRFRequestLogMiddleware:
+class AccessLogMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
-        self.logger = logging.getLogger('drf.request')
+        self.config = {
+            **ACCESS_LOG_DEFAULTS,
+            **getattr(settings, 'ACCESS_LOG', {}),
+        }
+        self.logger = logging.getLogger(self.config['LOGGER'])
+        self.routes = sorted(
+            self.config['ROUTES'].items(),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def sample_rate(self, path):
+        for prefix, rate in self.routes:
+            if path.startswith(prefix):
+                return rate
+        return self.config['SAMPLE_RATE']
+
+    def body_of(self, content_type, length, read):
+        if not self.config['LOG_BODIES'] or not length:
+            return None
+        if length > self.config['MAX_BODY_BYTES']:
+            return None
+        kind = content_type.split(';', 1)[0].strip().lower()
+        if kind in self.config['SKIP_BODY_CONTENT_TYPES']:
+            return None
+        return LazyMaskedBody(read())
 
     def __call__(self, request):
-        body = request.body.decode(errors='replace')[:2_000]
-        self.logger.info(
-            'REQUEST %s %s body=%s',
-            request.method,
-            request.path,
-            body,
-        )
+        sampled = random.random() < self.sample_rate(request.path)
+        request_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        request_body = None
+        if sampled:
+            request_body = self.body_of(
+                request.content_type or '',
+                request_length,
+                lambda: request.body,
+            )
+        started = time.perf_counter()
         response = self.get_response(request)
-        if hasattr(response, 'render') and callable(response.render):
-            response.render()
+        duration_ms = (time.perf_counter() - started) * 1000
 
-        resp_body = getattr(response, 'content', b'')[:2_000]
+        status = response.status_code
+        if not sampled and status < self.config['ALWAYS_LOG_STATUS']:
+            return response
+        if not self.logger.isEnabledFor(logging.INFO):
+            return response
 
+        response_length = None
+        response_body = None
+        if not getattr(response, 'streaming', False):
+            response_length = len(response.content)
+            response_body = self.body_of(
+                response.get('Content-Type', ''),
+                response_length,
+                lambda: response.content,
+            )
         self.logger.info(
-            'RESPONSE %s %s %s body=%s',
+            'ACCESS %s %s %s %.1fms',
             request.method,
             request.path,
-            response.status_code,
-            resp_body,
+            status,
+            duration_ms,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'status': status,
+                'duration_ms': round(duration_ms, 2),
+                'request_bytes': request_length,
+                'response_bytes': response_length,
+                'request_body': request_body,
+                'response_body': response_body,
+            },
         )
         return response
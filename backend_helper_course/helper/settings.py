@@ -59,6 +59,7 @@ if settings.DEBUG:
 INTERNAL_IPS = ['172.19.0.1', 'localhost', '127.0.0.1']
 
 MIDDLEWARE = [
+    'helper.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -67,9 +68,20 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'helper.middleware.DRFRequestLogMiddleware',
+    'helper.middleware.AccessLogMiddleware',
     'corsheaders.middleware.CorsMiddleware',
 ]
+ACCESS_LOG = {
+    'SAMPLE_RATE': float(os.getenv('ACCESS_LOG_SAMPLE_RATE') or 0.1),
+    'ROUTES': {
+        '/api/schema/': 0.0,
+        '/__debug__/': 0.0,
+        '/metrics/': 0.0,
+    },
+    'LOG_BODIES': os.getenv('ACCESS_LOG_BODIES', '').lower() == 'true',
+    'MAX_BODY_BYTES': 2_000,
+}
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 CORS_ALLOWED_ORIGINS = ['https://hobbymate.ru', 'http://localhost:5173']
 
 CORS_ALLOWED_HEADERS = [
@@ -99,9 +111,11 @@ SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 KEYCLOAK_REALM = 'hobbymate'
 KEYCLOAK_BASE_URL = 'http://hobbymate.ru/keycloak'
 KEYCLOAK_JWKS_URL = (
-    'http://keycloak:8080/keycloak/realms/',
-    'hobbymate/protocol/openid-connect/certs',
+    'http://keycloak:8080/keycloak/realms/'
+    'hobbymate/protocol/openid-connect/certs'
 )
+JWKS_REFRESH_INTERVAL = int(os.getenv('JWKS_REFRESH_INTERVAL', 300))
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv('JWKS_MIN_REFRESH_INTERVAL', 10))
 
 if settings.DEBUG:
     MIDDLEWARE += (
@@ -171,6 +185,12 @@ CELERY_RESULT_BACKEND = (
     f'redis://:{REDIS_PASSWORD}@{REDIS_HOST}:{REDIS_PORT}/4'
 )
 
+GROUPING_ENGINE = os.getenv(
+    'GROUPING_ENGINE',
+    'dialogs.engines.GreedyPackingEngine',
+)
+GROUPING_TIME_BUDGET = int(os.getenv('GROUPING_TIME_BUDGET', 60))
+
 CELERY_BEAT_SCHEDULE = {
     'deactivate-weekly-inactive': {
         'task': 'users.tasks.deactivate_inactive_users',
@@ -180,6 +200,11 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'dialogs.tasks.refresh_groups',
         'schedule': 600,
     },
+    'rebuild-groups-nightly': {
+        'task': 'dialogs.tasks.refresh_groups',
+        'schedule': crontab(hour=4, minute=0),
+        'kwargs': {'full': True},
+    },
 }
 TIME_ZONE = 'UTC'
 CELERY_TIMEZONE = TIME_ZONE
@@ -8,6 +8,8 @@ from drf_spectacular.views import (
     SpectacularSwaggerView,
 )
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('ckeditor5/', include('django_ckeditor_5.urls')),
@@ -15,6 +17,7 @@ urlpatterns = [
     path('api/', include('api.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
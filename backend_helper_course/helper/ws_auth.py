@@ -1,12 +1,23 @@
 from urllib.parse import parse_qs
 
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from django.contrib.auth.models import AnonymousUser
 
-from users.models import CustomUser
+from .auth import KeycloakJWTAuthentication, cached_claims, resolve_user
 
-from .auth import KeycloakJWTAuthentication
+_authenticator = KeycloakJWTAuthentication()
+
+
+async def authenticate_token(token):
+    payload = cached_claims(token)
+    if payload is None:
+        payload = await sync_to_async(
+            _authenticator.verify,
+            thread_sensitive=False,
+        )(token)
+    return await database_sync_to_async(resolve_user)(payload)
 
 
 class TokenAuthMiddleware(BaseMiddleware):
@@ -16,27 +27,8 @@ class TokenAuthMiddleware(BaseMiddleware):
         user = AnonymousUser()
 
         if token_list:
-            token = token_list[0]
             try:
-                authenticator = KeycloakJWTAuthentication()
-                validated = authenticator._decode(token)
-                authenticator._check_audience(validated)
-                username = (
-                    validated.get('preferred_username')
-                    or validated.get('email')
-                    or validated['sub']
-                )
-                user, _ = await database_sync_to_async(
-                    CustomUser.objects.update_or_create,
-                )(
-                    username=username,
-                    defaults={
-                        'email': validated.get('email', ''),
-                        'first_name': validated.get('given_name', ''),
-                        'last_name': validated.get('family_name', ''),
-                        'is_active': True,
-                    },
-                )
+                user = await authenticate_token(token_list[0])
             except Exception:
                 user = AnonymousUser()
 
@@ -0,0 +1,458 @@
+import csv
+import io
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from custom_groups.models import CustomGroup, GroupMember, members_signature
+from dialogs.models import (
+    Dialog,
+    DialogMembership,
+    GroupChat,
+    Message,
+    Notification,
+)
+from users.models import NUM_INTERESTS, CustomUser, Liked, MutualLike, Rejected
+
+CITIES = [
+    ('Москва', 55.7558, 37.6173),
+    ('Санкт-Петербург', 59.9343, 30.3351),
+    ('Новосибирск', 55.0084, 82.9357),
+    ('Екатеринбург', 56.8389, 60.6057),
+    ('Казань', 55.7961, 49.1064),
+    ('Нижний Новгород', 56.2965, 43.9361),
+    ('Челябинск', 55.1644, 61.4368),
+    ('Самара', 53.1959, 50.1002),
+    ('Омск', 54.9885, 73.3242),
+    ('Ростов-на-Дону', 47.2357, 39.7015),
+    ('Уфа', 54.7388, 55.9721),
+    ('Красноярск', 56.0153, 92.8932),
+    ('Воронеж', 51.6720, 39.1843),
+    ('Пермь', 58.0105, 56.2502),
+    ('Волгоград', 48.7080, 44.5133),
+]
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Павел', 'Ольга', 'Денис', 'Елена']
+LAST_NAMES = ['Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Орлов']
+MESSAGES = ['Привет!', 'Как дела?', 'Пойдём в субботу?', 'Отлично', 'Ок']
+KM_PER_DEGREE = 111.32
+FAVOURITES = 3
+CHUNK_BYTES = 8 * 1024 * 1024
+STAMPS = 10_000
+
+
+def table(model):
+    return model._meta.db_table
+
+
+def copy_rows(cursor, model, columns, rows):
+    sql = (
+        f'COPY {table(model)} ({", ".join(columns)}) '
+        'FROM STDIN WITH (FORMAT csv)'
+    )
+    total = 0
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow(row)
+        total += 1
+        if buf.tell() >= CHUNK_BYTES:
+            buf.seek(0)
+            cursor.copy_expert(sql, buf)
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+    if buf.tell():
+        buf.seek(0)
+        cursor.copy_expert(sql, buf)
+    return total
+
+
+def reserve_ids(cursor, model, n):
+    if not n:
+        return np.empty(0, dtype=np.int64)
+    cursor.execute(
+        'SELECT setval(pg_get_serial_sequence(%s, %s), '
+        'nextval(pg_get_serial_sequence(%s, %s)) + %s - 1)',
+        [table(model), 'id', table(model), 'id', n],
+    )
+    (last,) = cursor.fetchone()
+    return np.arange(last - n + 1, last + 1, dtype=np.int64)
+
+
+def vector_literal(row):
+    return '[' + ','.join(str(v) for v in row) + ']'
+
+
+def unique_pairs(src, dst, n):
+    keys = np.unique(src[src != dst] * n + dst[src != dst])
+    return keys // n, keys % n
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетический датасет для нагрузочных замеров.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument(
+            '--likes-per-user',
+            type=float,
+            default=10,
+            help='Среднее число исходящих лайков.',
+        )
+        parser.add_argument(
+            '--reciprocity',
+            type=float,
+            default=0.3,
+            help='Доля лайков, на которые ответили взаимностью.',
+        )
+        parser.add_argument('--rejects-per-user', type=float, default=5)
+        parser.add_argument(
+            '--local-share',
+            type=float,
+            default=0.9,
+            help='Доля лайков внутри своего города.',
+        )
+        parser.add_argument('--cities', type=int, default=len(CITIES))
+        parser.add_argument('--city-spread-km', type=float, default=15)
+        parser.add_argument(
+            '--dialog-share',
+            type=float,
+            default=0.5,
+            help='Доля взаимных пар, у которых есть диалог.',
+        )
+        parser.add_argument('--messages-per-dialog', type=float, default=10)
+        parser.add_argument(
+            '--group-share',
+            type=float,
+            default=0.2,
+            help='Доля пользователей, уже состоящих в группе.',
+        )
+        parser.add_argument(
+            '--unread-share',
+            type=float,
+            default=0.2,
+            help='Доля участников диалогов с непрочитанным.',
+        )
+        parser.add_argument('--prefix', default='gen_')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not 1 <= options['cities'] <= len(CITIES):
+            raise CommandError(f'--cities: от 1 до {len(CITIES)}')
+        if options['users'] < 2:
+            raise CommandError('--users: минимум 2')
+        self.options = options
+        self.rng = np.random.default_rng(options['seed'])
+        now = timezone.now()
+        self.stamps = np.array(
+            [
+                (now - timedelta(seconds=int(s))).isoformat()
+                for s in self.rng.integers(0, 30 * 86400, STAMPS)
+            ],
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL synchronous_commit = off')
+            self.cursor = cursor
+            self.step('users', self.make_users)
+            self.step('likes', self.make_likes)
+            self.step('rejections', self.make_rejections)
+            self.step('groups', self.make_groups)
+            self.step('dialogs', self.make_dialogs)
+        with connection.cursor() as cursor:
+            for model in (CustomUser, Liked, Rejected, Message):
+                cursor.execute(f'ANALYZE {table(model)}')
+
+    def step(self, name, fn):
+        started = time.perf_counter()
+        count = fn()
+        self.stdout.write(
+            f'{name}: {count} за {time.perf_counter() - started:.1f}s',
+        )
+
+    def stamp(self, size):
+        return self.stamps[self.rng.integers(0, STAMPS, size)].tolist()
+
+    def make_users(self):
+        rng, n = self.rng, self.options['users']
+        cities = CITIES[: self.options['cities']]
+        weights = 1 / np.arange(1, len(cities) + 1)
+        self.city = np.sort(
+            rng.choice(len(cities), n, p=weights / weights.sum()),
+        )
+        self.starts = np.searchsorted(self.city, np.arange(len(cities)))
+        self.sizes = np.bincount(self.city, minlength=len(cities))
+        self.ids = reserve_ids(self.cursor, CustomUser, n)
+
+        centre = np.array([(lat, lon) for _, lat, lon in cities])[self.city]
+        spread = self.options['city_spread_km'] / KM_PER_DEGREE
+        lat = centre[:, 0] + rng.normal(0, spread, n)
+        lon = centre[:, 1] + rng.normal(0, spread, n) / np.cos(
+            np.radians(lat),
+        )
+
+        taste = rng.dirichlet(np.ones(NUM_INTERESTS), len(cities))
+        vectors = rng.integers(1, 4, (n, NUM_INTERESTS))
+        noise = rng.random((n, NUM_INTERESTS)) * taste[self.city]
+        top = np.argpartition(-noise, FAVOURITES, axis=1)[:, :FAVOURITES]
+        np.put_along_axis(
+            vectors,
+            top,
+            rng.integers(4, 6, (n, FAVOURITES)),
+            axis=1,
+        )
+        min_size = rng.integers(3, 6, n)
+        max_size = min_size + rng.integers(1, 4, n)
+        stamps = self.stamp(n)
+        prefix = self.options['prefix']
+
+        def rows():
+            for i in range(n):
+                uid = int(self.ids[i])
+                yield (
+                    uid,
+                    '!',
+                    False,
+                    f'{prefix}{uid}',
+                    FIRST_NAMES[uid % len(FIRST_NAMES)],
+                    LAST_NAMES[uid % len(LAST_NAMES)],
+                    f'{prefix}{uid}@example.com',
+                    False,
+                    True,
+                    stamps[i],
+                    '',
+                    True,
+                    int(min_size[i]),
+                    int(max_size[i]),
+                    1,
+                    False,
+                    stamps[i],
+                    stamps[i],
+                    vector_literal(vectors[i]),
+                    f'SRID=4326;POINT({lon[i]:.6f} {lat[i]:.6f})',
+                    cities[self.city[i]][0],
+                )
+
+        return copy_rows(
+            self.cursor,
+            CustomUser,
+            [
+                'id',
+                'password',
+                'is_superuser',
+                'username',
+                'first_name',
+                'last_name',
+                'email',
+                'is_staff',
+                'is_active',
+                'date_joined',
+                'bio',
+                'is_can_write',
+                'min_group_size',
+                'max_group_size',
+                'max_simultaneous_groups',
+                'is_offline',
+                'created_at',
+                'updated_at',
+                'interest_vector',
+                'location',
+                'city_name',
+            ],
+            rows(),
+        )
+
+    def targets(self, src):
+        rng = self.rng
+        local = rng.random(len(src)) < self.options['local_share']
+        city = self.city[src]
+        dst = rng.integers(0, len(self.ids), len(src))
+        dst[local] = self.starts[city[local]] + (
+            rng.random(local.sum()) * self.sizes[city[local]]
+        ).astype(np.int64)
+        return dst
+
+    def outgoing(self, per_user):
+        counts = self.rng.poisson(per_user, len(self.ids))
+        src = np.repeat(np.arange(len(self.ids)), counts)
+        return src, self.targets(src)
+
+    def make_likes(self):
+        n = len(self.ids)
+        src, dst = self.outgoing(self.options['likes_per_user'])
+        back = self.rng.random(len(src)) < self.options['reciprocity']
+        src, dst = unique_pairs(
+            np.concatenate([src, dst[back]]),
+            np.concatenate([dst, src[back]]),
+            n,
+        )
+        self.like_keys = src * n + dst
+        mutual = (src < dst) & np.isin(dst * n + src, self.like_keys)
+        self.mutual = np.stack([src[mutual], dst[mutual]], axis=1)
+        stamps = self.stamp(len(src))
+        likes = copy_rows(
+            self.cursor,
+            Liked,
+            ['user_id', 'liked_user_id', 'created_at'],
+            zip(self.ids[src].tolist(), self.ids[dst].tolist(), stamps),
+        )
+        copy_rows(
+            self.cursor,
+            MutualLike,
+            ['user_id', 'partner_id', 'created_at'],
+            ((a, b, stamps[0]) for a, b in self.ids[self.mutual].tolist()),
+        )
+        return likes
+
+    def make_rejections(self):
+        n = len(self.ids)
+        src, dst = self.outgoing(self.options['rejects_per_user'])
+        src, dst = unique_pairs(src, dst, n)
+        fresh = ~np.isin(src * n + dst, self.like_keys)
+        src, dst = src[fresh], dst[fresh]
+        reasons = np.array([Rejected.SKIP, Rejected.DISLIKE])
+        return copy_rows(
+            self.cursor,
+            Rejected,
+            ['user_id', 'rejected_user_id', 'reason', 'created_at'],
+            zip(
+                self.ids[src].tolist(),
+                self.ids[dst].tolist(),
+                reasons[self.rng.integers(0, 2, len(src))].tolist(),
+                self.stamp(len(src)),
+            ),
+        )
+
+    def make_groups(self):
+        rng = self.rng
+        groups = []
+        for start, size in zip(self.starts, self.sizes):
+            members = rng.permutation(np.arange(start, start + size))
+            members = members[: int(size * self.options['group_share'])]
+            while len(members) >= 3:
+                take = int(min(rng.integers(3, 8), len(members)))
+                groups.append(self.ids[members[:take]].tolist())
+                members = members[take:]
+        group_ids = reserve_ids(self.cursor, CustomGroup, len(groups))
+        stamps = self.stamp(len(groups))
+        first = int(self.ids[0])
+        copy_rows(
+            self.cursor,
+            CustomGroup,
+            ['id', 'name', 'description', 'created_at', 'member_signature'],
+            (
+                (
+                    int(gid),
+                    f'{CITIES[self.city[members[0] - first]][0]} #{gid}',
+                    '',
+                    stamps[i],
+                    members_signature(members),
+                )
+                for i, (gid, members) in enumerate(zip(group_ids, groups))
+            ),
+        )
+        copy_rows(
+            self.cursor,
+            GroupMember,
+            ['user_id', 'group_id', 'joined_at', 'is_active', 'is_admin'],
+            (
+                (uid, int(gid), stamps[i], True, j == 0)
+                for i, (gid, members) in enumerate(zip(group_ids, groups))
+                for j, uid in enumerate(members)
+            ),
+        )
+        self.groups = list(zip(group_ids.tolist(), groups))
+        return len(groups)
+
+    def make_dialogs(self):
+        rng = self.rng
+        chosen = rng.random(len(self.mutual)) < self.options['dialog_share']
+        rooms = [self.ids[pair].tolist() for pair in self.mutual[chosen]]
+        rooms += [members for _, members in self.groups]
+        dialog_ids = reserve_ids(self.cursor, Dialog, len(rooms)).tolist()
+        stamps = self.stamp(len(rooms))
+        copy_rows(
+            self.cursor,
+            Dialog,
+            ['id', 'is_active', 'created_at'],
+            ((did, True, stamps[i]) for i, did in enumerate(dialog_ids)),
+        )
+        group_chats = dialog_ids[len(rooms) - len(self.groups) :]
+        copy_rows(
+            self.cursor,
+            GroupChat,
+            ['dialog_ptr_id', 'group_id'],
+            zip(group_chats, (gid for gid, _ in self.groups)),
+        )
+
+        counts = rng.poisson(self.options['messages_per_dialog'], len(rooms))
+        room_of = np.repeat(np.arange(len(rooms)), counts)
+        sizes = np.array([len(members) for members in rooms])
+        senders = (rng.random(len(room_of)) * sizes[room_of]).astype(int)
+        texts = rng.integers(0, len(MESSAGES), len(room_of))
+        copy_rows(
+            self.cursor,
+            Message,
+            ['dialog_id', 'sender_id', 'text', 'created_at'],
+            (
+                (dialog_ids[r], rooms[r][sender], MESSAGES[text], at)
+                for r, sender, text, at in zip(
+                    room_of.tolist(),
+                    senders.tolist(),
+                    texts.tolist(),
+                    self.stamp(len(room_of)),
+                )
+            ),
+        )
+
+        memberships = [
+            (did, uid, at)
+            for did, members, at in zip(dialog_ids, rooms, stamps)
+            for uid in members
+        ]
+        unread = rng.random(len(memberships)) < self.options['unread_share']
+        unread = np.where(unread, rng.integers(1, 6, len(memberships)), 0)
+        copy_rows(
+            self.cursor,
+            DialogMembership,
+            ['dialog_id', 'customuser_id', 'unread_count', 'last_activity_at'],
+            (
+                (did, uid, count, at)
+                for (did, uid, at), count in zip(memberships, unread.tolist())
+            ),
+        )
+        copy_rows(
+            self.cursor,
+            Notification,
+            [
+                'user_id',
+                'dialog_id',
+                'kind',
+                'count',
+                'text',
+                'created_at',
+                'read',
+            ],
+            (
+                (uid, did, Notification.MESSAGE, count, MESSAGES[0], at, False)
+                for (did, uid, _), count, at in zip(
+                    memberships,
+                    unread.tolist(),
+                    self.stamp(len(memberships)),
+                )
+                if count
+            ),
+        )
+        if dialog_ids:
+            self.cursor.execute(
+                f'UPDATE {table(DialogMembership)} m '
+                'SET last_activity_at = last.at '
+                'FROM (SELECT dialog_id, max(created_at) AS at '
+                f'FROM {table(Message)} WHERE dialog_id BETWEEN %s AND %s '
+                'GROUP BY dialog_id) last '
+                'WHERE m.dialog_id = last.dialog_id',
+                [dialog_ids[0], dialog_ids[-1]],
+            )
+        return len(rooms)
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:00
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0015_enable_vector_extension'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=['interest_vector'],
+                m=16,
+                name='users_interest_vec_hnsw',
+                opclasses=['vector_l2_ops'],
+            ),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-17 10:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BACKFILL_SQL = '''
+INSERT INTO users_mutuallike (user_id, partner_id, created_at)
+SELECT a.user_id, a.liked_user_id, GREATEST(a.created_at, b.created_at)
+FROM users_liked a
+JOIN users_liked b
+  ON b.user_id = a.liked_user_id AND b.liked_user_id = a.user_id
+WHERE a.user_id < a.liked_user_id
+ON CONFLICT DO NOTHING;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_customuser_users_interest_vec_hnsw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MutualLike',
+            fields=[
+                (
+                    'id',
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'created_at',
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                (
+                    'partner',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='mutual_likes_as_partner',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    'user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='mutual_likes',
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                'indexes': [
+                    models.Index(
+                        fields=['partner'],
+                        name='users_mutua_partner_a7c148_idx',
+                    ),
+                ],
+                'constraints': [
+                    models.CheckConstraint(
+                        condition=models.Q(
+                            ('user__lt', models.F('partner')),
+                        ),
+                        name='mutuallike_ordered_pair',
+                    ),
+                ],
+                'unique_together': {('user', 'partner')},
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -1,7 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.contrib.gis.db import models as gis
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 from phonenumber_field.modelfields import PhoneNumberField
 
 NUM_INTERESTS = 15
@@ -55,6 +55,17 @@ class CustomUser(AbstractUser):
         null=True,
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            HnswIndex(
+                name='users_interest_vec_hnsw',
+                fields=['interest_vector'],
+                m=16,
+                ef_construction=64,
+                opclasses=['vector_l2_ops'],
+            ),
+        ]
+
     def __str__(self):  # pragma: no cover
         return self.username
 
@@ -111,3 +122,40 @@ class Liked(models.Model):
         indexes = [
             models.Index(fields=['user']),
         ]
+
+
+class MutualLike(models.Model):
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='mutual_likes',
+    )
+    partner = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='mutual_likes_as_partner',
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'partner')
+        indexes = [
+            models.Index(fields=['partner']),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(user__lt=models.F('partner')),
+                name='mutuallike_ordered_pair',
+            ),
+        ]
+
+    @classmethod
+    def link(cls, user_id, other_id):
+        low, high = sorted((user_id, other_id))
+        cls.objects.bulk_create(
+            [cls(user_id=low, partner_id=high)],
+            ignore_conflicts=True,
+        )
+
+    def __str__(self):  # pragma: no cover
+        return f'{self.user_id} <-> {self.partner_id}'
@@ -45,10 +45,18 @@ function Layout() {
 
     w.onmessage = (e) => {
       try {
-        const n = JSON.parse(e.data);
-        if (Number(n.dialog) === openId) return;
+        const data = JSON.parse(e.data);
+        if (data.more) w.send(JSON.stringify({ type: 'more' }));
+        const items = (data.type === 'batch' ? data.items : [data]).filter(
+          (n) => Number(n.dialog) !== openId,
+        );
+        if (!items.length) return;
 
-        setNotes((prev) => [{ id: Date.now(), ...n, read: false }, ...prev]);
+        const stamp = Date.now();
+        setNotes((prev) => [
+          ...items.map((n, i) => ({ ...n, id: n.id ?? `${stamp}-${i}`, read: false })),
+          ...prev,
+        ]);
       } catch (err) {
         console.error('WS notify parse error', err);
       }
@@ -16,6 +16,13 @@ const safeSrc = (value, fallback = '/default-avatar.png') => {
   return fallback;
 };
 
+// Курсор следующей страницы из заголовка Link (rel="prev" / rel="next").
+const linkCursor = (header, rel) => {
+  const part = (header || '').split(',').find((p) => p.includes(`rel="${rel}"`));
+  const url = part?.match(/<([^>]+)>/)?.[1];
+  return url ? new URL(url, window.location.origin).searchParams.get('before') : null;
+};
+
 export default function ChatPage() {
   const { id } = useParams();
   const wsRef = useRef(null);
@@ -25,11 +32,13 @@ export default function ChatPage() {
   const [dialogs, setDialogs] = useState([]);
   const [meta, setMeta] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
   const [myContacts, setMyContacts] = useState({});
   const [text, setText] = useState('');
 
   const [loadingDialogs, setLD] = useState(true);
   const [loadingMsgs, setLM] = useState(false);
+  const [loadingOlder, setLO] = useState(false);
 
   useEffect(() => {
     setOpen(id ? Number(id) : null);
@@ -51,10 +60,20 @@ export default function ChatPage() {
   }, []);
 
   useEffect(() => {
-    axios
-      .get('/api/dialogs/me/')
-      .then(({ data }) => setDialogs(data))
+    let cancelled = false;
+    // Список диалогов отдаётся страницами, следующая — в заголовке Link.
+    const loadPage = (before, loaded) =>
+      axios.get('/api/dialogs/me/', { params: { before } }).then(({ data, headers }) => {
+        const all = [...loaded, ...data];
+        const next = linkCursor(headers.link, 'next');
+        return next && !cancelled ? loadPage(next, all) : all;
+      });
+    loadPage(undefined, [])
+      .then((all) => !cancelled && setDialogs(all))
       .finally(() => setLD(false));
+    return () => {
+      cancelled = true;
+    };
   }, []);
 
   useEffect(() => {
@@ -69,10 +88,17 @@ export default function ChatPage() {
 
   useEffect(() => {
     if (!id) return;
-    setTimeout(() => setLM(true), 0);
+    setTimeout(() => {
+      setLM(true);
+      setOlderCursor(null);
+    }, 0);
     axios
       .get(`/api/dialogs/${id}/messages/`)
-      .then(({ data }) => setMessages(data))
+      .then(({ data, headers }) => {
+        setMessages(data);
+        setOlderCursor(linkCursor(headers.link, 'prev'));
+      })
+      .then(() => axios.post(`/api/dialogs/${id}/read/`))
       .finally(() => setLM(false));
 
     const token = localStorage.getItem('kc_token');
@@ -97,9 +123,25 @@ export default function ChatPage() {
     ws.onerror = (ev) => console.error('[WS] ERROR', ev);
 
     wsRef.current = ws;
-    return () => ws.close(1000, 'unmount');
+    return () => {
+      ws.close(1000, 'unmount');
+      axios.post(`/api/dialogs/${id}/read/`).catch(() => {});
+    };
   }, [id]);
 
+  const loadOlder = () => {
+    if (!olderCursor || loadingOlder) return;
+    setLO(true);
+    axios
+      .get(`/api/dialogs/${id}/messages/`, { params: { before: olderCursor } })
+      .then(({ data, headers }) => {
+        setMessages((prev) => [...data, ...prev]);
+        setOlderCursor(linkCursor(headers.link, 'prev'));
+      })
+      .catch(console.error)
+      .finally(() => setLO(false));
+  };
+
   const send = (overrideText) => {
     const body = (overrideText ?? text).trim();
     if (!body || !id || wsRef.current.readyState !== WebSocket.OPEN) return;
@@ -188,6 +230,15 @@ export default function ChatPage() {
             </div>
 
             <div className="flex-1 overflow-y-auto p-4 space-y-4">
+              {!loadingMsgs && olderCursor && (
+                <button
+                  onClick={loadOlder}
+                  disabled={loadingOlder}
+                  className="block mx-auto text-sm text-blue-600 hover:underline disabled:opacity-50"
+                >
+                  {loadingOlder ? 'Загрузка…' : 'Показать более ранние сообщения'}
+                </button>
+              )}
               {loadingMsgs ? (
                 <p>Загрузка…</p>
               ) : (